@@ -0,0 +1,110 @@
+import argparse
+import gc
+import os
+import random
+import time
+import numpy as np
+from serve_fasttext import WordToVectorDict
+from word_vectors import Int8Matrix, PQMatrix, Vocabulary
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def cosine(a, b):
+    # vectors of words without any trained n-gram are zeros, and only similar to zeros
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return np.where(norms > 0, (a * b).sum(axis=1) / np.maximum(norms, np.finfo(np.float32).tiny),
+                    (a == b).all(axis=1))
+
+
+def matrices(vocab):
+    return [vocab.vectors] + ([vocab.subwords.input_matrix] if vocab.subwords is not None else [])
+
+
+def matrix_bytes(vocab):
+    return sum(matrix.nbytes for matrix in matrices(vocab))
+
+
+def rss_bytes():
+    # the resident set size of this process, memory-mapped pages it has read included
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def touch(vocab, block_size=65536):
+    """Reads every page of the matrices of ``vocab``, as a server does once it has seen every word."""
+    for matrix in matrices(vocab):
+        if isinstance(matrix, Int8Matrix):
+            arrays = [matrix.data, matrix.scales]
+        elif isinstance(matrix, PQMatrix):
+            arrays = [matrix.codes, matrix.codebooks]
+        else:
+            arrays = [matrix]
+        for array in arrays:
+            for start in range(0, len(array), block_size):
+                np.asarray(array[start:start + block_size]).max()
+
+
+def time_batches(vectors, words, batch_size):
+    """Returns the vectors of ``words`` and the median time to compute a batch of them, in ms."""
+    results, times = [], []
+    for i in range(0, len(words), batch_size):
+        start = time.perf_counter()
+        results.append(vectors.matrix(words[i:i + batch_size]))
+        times.append(time.perf_counter() - start)
+    return np.concatenate(results), 1000 * float(np.median(times))
+
+
+def main():
+    """
+    Compares quantized vocabularies written by `quantize_fasttext_vocab.py` with the full one: the
+    size of their matrices, the memory resident once all of them has been read, the latency of
+    lookups and the cosine similarity of their vectors with the full ones, for in-vocabulary and
+    out-of-vocabulary words.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--vocab', required=True, help='full vocabulary exported by export_fasttext_vocab.py')
+    parser.add_argument('-c', '--compact', nargs='+', required=True, help='quantized vocabularies to compare')
+    parser.add_argument('--words', type=int, default=10000, help='number of words to sample')
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    full = Vocabulary(args.vocab)
+    rng = random.Random(0)
+    in_vocab = [full.word(row) for row in rng.sample(range(len(full)), min(args.words, len(full)))]
+    # misspellings of in-vocabulary words, which are mostly unknown
+    oov = [w[:len(w) // 2] + 'q' + w[len(w) // 2:] for w in in_vocab]
+    oov = [w for w, row in zip(oov, full.rows(oov)) if row < 0]
+    samples = {'in-vocab': in_vocab}
+    if full.subwords is not None:
+        samples['oov'] = oov
+
+    print(f'{"vocabulary":<40} {"sample":>8} {"file MB":>10} {"RSS MB":>10} {"ms/batch":>10} {"mean cos":>10} '
+          f'{"min cos":>10}')
+    reference = {}
+    del full
+    for path in [args.vocab] + args.compact:
+        # unmap the previous vocabulary, so that its pages no longer count
+        gc.collect()
+        before = rss_bytes()
+        vocab = Vocabulary(path)
+        vectors = WordToVectorDict(vocab=vocab)
+        touch(vocab)
+        resident = rss_bytes() - before
+        for kind, words in samples.items():
+            result, latency = time_batches(vectors, words, args.batch_size)
+            if path == args.vocab:
+                reference[kind] = result
+            similarity = cosine(result, reference[kind])
+            print(f'{path[-40:]:<40} {kind:>8} {matrix_bytes(vocab) / 2 ** 20:>10.1f} {resident / 2 ** 20:>10.1f} '
+                  f'{latency:>10.2f} {similarity.mean():>10.5f} {similarity.min():>10.5f}')
+        del vocab, vectors
+
+
+if __name__ == '__main__':
+    main()
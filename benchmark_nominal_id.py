@@ -0,0 +1,58 @@
+import argparse
+import time
+import numpy as np
+from allennlp.data.tokenizers import Token
+from cogcomp_srl.id_nominal import NominalIdPredictor
+from cogcomp_srl.id_nominal.nombank_reader import separate_hyphens
+from serving import synthetic_sentence
+
+NOM_ID_MODEL_PATH = 'checkpoints/cogcomp-nom-id.tar.gz'
+
+
+def instances_per_token(predictor, tokens):
+    # What `NominalIdPredictor` used to build: the same instance once per token, of which it kept the first.
+    new_tokens = [Token(t) for t in separate_hyphens([token.text for token in tokens])[0]]
+    return [predictor._dataset_reader.text_to_instance(tokens, new_tokens) for _ in tokens]
+
+
+def median_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times))
+
+
+def main():
+    """
+    Times the nominal identification front-end on a batch of long sentences: building one instance
+    per token as it used to, one instance per sentence, the model inputs without instances as it
+    does now, and the whole prediction.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--model', default=NOM_ID_MODEL_PATH)
+    parser.add_argument('--length', type=int, default=50, help='number of words per sentence')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--cpu', action='store_true')
+    args = parser.parse_args()
+
+    predictor = NominalIdPredictor.from_path(args.model, predictor_name='nombank-id',
+                                             cuda_device=-1 if args.cpu else 0)
+    tokens = predictor._tokenizer.batch_split_words([synthetic_sentence(args.length)] * args.batch_size)
+    predictor.predict_batch_tokens(tokens)
+
+    per_token = median_ms(lambda: [instances_per_token(predictor, t) for t in tokens], args.repeats)
+    per_sentence = median_ms(lambda: [predictor.tokens_to_instance(t) for t in tokens], args.repeats)
+    arrays = median_ms(lambda: [predictor.tokens_to_arrays(t) for t in tokens], args.repeats)
+    predict = median_ms(lambda: predictor.predict_batch_tokens(tokens), args.repeats)
+    print(f'{args.batch_size} sentences of {len(tokens[0])} tokens, ms per batch:')
+    print(f'{"instances, one per token (before)":<40} {per_token:>10.1f}')
+    print(f'{"instances, one per sentence":<40} {per_sentence:>10.1f} ({per_token / per_sentence:.0f}x)')
+    print(f'{"tokens_to_arrays, no instances":<40} {arrays:>10.1f} ({per_token / arrays:.0f}x)')
+    print(f'{"predict_batch_tokens":<40} {predict:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
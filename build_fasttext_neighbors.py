@@ -0,0 +1,23 @@
+import argparse
+from word_vectors import Vocabulary, build_neighbor_index
+
+
+def main():
+    """
+    Builds the nearest-neighbor index of `serve_fasttext.py --neighbors` from a vocabulary exported
+    by `export_fasttext_vocab.py`.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--vocab', required=True, help='vocabulary exported by export_fasttext_vocab.py')
+    parser.add_argument('-o', '--output', required=True, help='directory to write the index to')
+    parser.add_argument('--words', type=int, default=None,
+                        help='only index this many of the most frequent words (default: all)')
+    parser.add_argument('--lists', type=int, default=0,
+                        help='number of inverted lists for approximate search, 0 for exact search only')
+    args = parser.parse_args()
+
+    build_neighbor_index(Vocabulary(args.vocab), args.output, words=args.words, lists=args.lists)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
+import json
+import numpy as np
 import requests
 from dataclasses import dataclass
-from typing import List
+from typing import Iterator, List, Optional
 
 
 @dataclass
@@ -37,6 +39,18 @@ class WebNomSRLPredictor:
         res_json = self.session.post(self.url, json=[{'sentence': s} for s in sentences]).json()
         return [self.sanitize(dic) for dic in res_json]
 
+    def batch_predict_stream(self, sentences: List[str]) -> Iterator[NomSRLResult]:
+        """
+        Like `batch_predict`, but yields each result as soon as the server has it.
+        """
+        with self.session.post(self.url, params={'stream': 1}, json=[{'sentence': s} for s in sentences],
+                               stream=True) as resp:
+            for line in resp.iter_lines():
+                dic = json.loads(line)
+                if 'error' in dic:
+                    raise RuntimeError(dic['error'])
+                yield self.sanitize(dic)
+
 
 @dataclass
 class VerbFrame:
@@ -70,3 +84,54 @@ class WebVerbSRLPredictor:
     def batch_predict(self, sentences: List[str]) -> List[VerbSRLResult]:
         res_json = self.session.post(self.url, json=[{'sentence': s} for s in sentences]).json()
         return [self.sanitize(dic) for dic in res_json]
+
+    def batch_predict_stream(self, sentences: List[str]) -> Iterator[VerbSRLResult]:
+        """
+        Like `batch_predict`, but yields each result as soon as the server has it.
+        """
+        with self.session.post(self.url, params={'stream': 1}, json=[{'sentence': s} for s in sentences],
+                               stream=True) as resp:
+            for line in resp.iter_lines():
+                dic = json.loads(line)
+                if 'error' in dic:
+                    raise RuntimeError(dic['error'])
+                yield self.sanitize(dic)
+
+
+class WebFastText:
+    def __init__(self, host='127.0.0.1', port=8980):
+        self.url = f'http://{host}:{port}/fasttext'
+        self.session = requests.Session()
+
+    def get_vectors(self, tokens: List[str]) -> np.ndarray:
+        """
+        Returns a read-only float32 array of shape `(len(tokens), dim)`, decoded without copying
+        from the binary response of the server.
+        """
+        resp = self.session.post(self.url, json=tokens, headers={'Accept': 'application/octet-stream'})
+        resp.raise_for_status()
+        shape = tuple(int(x) for x in resp.headers['X-Vector-Shape'].split(','))
+        return np.frombuffer(resp.content, dtype='<f4').reshape(shape)
+
+    def embed(self, texts: List[str], pooling: str = 'mean') -> np.ndarray:
+        """
+        Returns one embedding per text, pooled on the server from the vectors of its words:
+        `'mean'` averages them, `'sif'` weights them by their smooth inverse frequency first.
+        """
+        resp = self.session.post(f'{self.url}/embed', json={'texts': texts, 'pooling': pooling},
+                                 headers={'Accept': 'application/octet-stream'})
+        resp.raise_for_status()
+        shape = tuple(int(x) for x in resp.headers['X-Vector-Shape'].split(','))
+        return np.frombuffer(resp.content, dtype='<f4').reshape(shape)
+
+    def get_neighbors(self, tokens: List[str], k: int = 10, nprobe: Optional[int] = None) -> List[List[dict]]:
+        """
+        Returns the `k` nearest words of each token as `{'word': ..., 'score': ...}` dicts, best
+        first. With `nprobe`, the server searches that many of its inverted lists only.
+        """
+        params = {'tokens': tokens, 'k': k}
+        if nprobe is not None:
+            params['nprobe'] = nprobe
+        resp = self.session.post(f'{self.url}/neighbors', json=params)
+        resp.raise_for_status()
+        return resp.json()['neighbors']
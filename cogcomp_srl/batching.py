@@ -0,0 +1,198 @@
+import weakref
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from allennlp.data import Instance
+from allennlp.models import Model
+
+# Default budgets of the forward passes of the predictors of this process, see `configure_batching`.
+_max_tokens = 8192
+_max_memory = 1024 * 2 ** 20
+
+RECOVERY_PASSES = 32
+
+
+class _MemoryCeiling:
+    """
+    The activation memory the forward passes of one model are kept below: lowered when a pass
+    runs out of memory despite the budget, and raised back towards the budget after
+    ``RECOVERY_PASSES`` passes in a row that did not. ``None`` when it is the budget.
+    """
+
+    def __init__(self):
+        self.memory: Optional[int] = None
+        self.passes = 0
+
+    def within(self, max_memory: int) -> int:
+        return max_memory if self.memory is None else min(max_memory, self.memory)
+
+    def back_off(self, batch_size: int, batch_memory: int):
+        if torch.cuda.is_initialized():
+            torch.cuda.empty_cache()
+        self.passes = 0
+        ceiling = batch_memory // 2
+        if self.memory is None or ceiling < self.memory:
+            self.memory = ceiling
+            print(f'Out of memory in a forward pass of {batch_size} instances, '
+                  f'limiting batches to {ceiling / 2 ** 20:.0f} MB of activations')
+
+    def recover(self, max_memory: int):
+        # An out of memory error may have been transient (fragmentation, another process on the GPU):
+        # double the ceiling after enough passes in a row, up to the budget.
+        if self.memory is None:
+            return
+        self.passes += 1
+        if self.passes < RECOVERY_PASSES:
+            return
+        self.passes = 0
+        self.memory *= 2
+        if self.memory >= max_memory:
+            self.memory = None
+        print(f'Raising batches to {(self.memory or max_memory) / 2 ** 20:.0f} MB of activations')
+
+
+# One ceiling per model: the models hosted together by the gateway do not share their memory.
+_ceilings = weakref.WeakKeyDictionary()  # model -> _MemoryCeiling
+
+
+def _ceiling(model: Model) -> _MemoryCeiling:
+    ceiling = _ceilings.get(model)
+    if ceiling is None:
+        ceiling = _ceilings[model] = _MemoryCeiling()
+    return ceiling
+
+
+def configure_batching(max_tokens: int = 8192, max_memory_mb: int = 1024):
+    """
+    Sets the wordpiece and activation memory budgets of every forward pass of the CogComp
+    predictors of this process.
+    """
+    global _max_tokens, _max_memory
+    _max_tokens = max_tokens
+    _max_memory = max_memory_mb * 2 ** 20
+    _ceilings.clear()
+
+
+def instance_length(instance: Instance) -> int:
+    # The wordpieces of the sentence, with [CLS] and [SEP]: what the batch is padded to.
+    return instance.fields["tokens"].sequence_length()
+
+
+def attention_shape(model: Model) -> Tuple[int, int]:
+    """
+    The attention heads and hidden size of the BERT encoder of ``model``, those of BERT base if
+    it has none.
+    """
+    config = getattr(getattr(model, "bert_model", None), "config", None)
+    return getattr(config, "num_attention_heads", 12), getattr(config, "hidden_size", 768)
+
+
+def activation_bytes(batch_size: int, length: int, heads: int = 12, hidden: int = 768) -> int:
+    """
+    Estimates the memory the activations of a forward pass of ``batch_size`` instances padded to
+    ``length`` wordpieces take. Without gradients, one layer is alive at a time: its attention
+    scores and probabilities, ``heads * length ** 2`` floats each, and its hidden states, with
+    the four times wider ones of its feed-forward layer.
+    """
+    return 4 * batch_size * (2 * heads * length ** 2 + 6 * hidden * length)
+
+
+def plan_batches(lengths: List[int], max_tokens: int, max_memory: Optional[int] = None,
+                 memory: Callable[[int, int], int] = activation_bytes) -> List[List[int]]:
+    """
+    Groups the indices of instances of ``lengths`` into batches of similar lengths, so that
+    little of each batch is padding: instances are taken longest first, and a batch grows as long
+    as its size times its longest instance stays within ``max_tokens``, and the ``memory`` of its
+    size and longest instance within ``max_memory``. An instance over either budget gets a batch
+    of its own.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for index in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        # the first instance of a batch is its longest
+        if batch and ((len(batch) + 1) * lengths[batch[0]] > max_tokens or
+                      max_memory is not None and memory(len(batch) + 1, lengths[batch[0]]) > max_memory):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    # CUDA and CPU allocators of torch raise a `RuntimeError`, numpy and Python a `MemoryError`.
+    message = str(error)
+    return isinstance(error, MemoryError) or isinstance(error, RuntimeError) and (
+        "out of memory" in message or "can't allocate memory" in message)
+
+
+def forward_in_batches(model: Model, instances: List[Instance], max_tokens: int = None,
+                       max_memory: int = None) -> List[Dict]:
+    """
+    Runs ``model`` on ``instances`` in the batches of ``plan_batches``, and returns their outputs
+    in the order of ``instances``. A batch that runs out of memory is split in two and retried,
+    and the later batches of ``model`` are kept below it until enough passes succeed.
+    """
+    return run_in_batches(lambda batch: model.forward_on_instances([instances[i] for i in batch]),
+                          [instance_length(instance) for instance in instances], model, max_tokens, max_memory)
+
+
+def run_in_batches(run: Callable[[List[int]], List[Dict]], lengths: List[int], model: Model,
+                   max_tokens: int = None, max_memory: int = None) -> List[Dict]:
+    """
+    Like ``forward_in_batches``, for inputs of ``lengths`` wordpieces that ``run`` passes through
+    ``model`` a batch of indices at a time.
+    """
+    heads, hidden = attention_shape(model)
+
+    def memory(batch_size: int, length: int) -> int:
+        return activation_bytes(batch_size, length, heads, hidden)
+
+    max_memory = max_memory or _max_memory
+    ceiling = _ceiling(model)
+    outputs: List[Dict] = [None] * len(lengths)
+    for batch in plan_batches(lengths, max_tokens or _max_tokens, ceiling.within(max_memory), memory):
+        if memory(len(batch), lengths[batch[0]]) > ceiling.within(max_memory):
+            # an earlier batch ran out of memory: split this one as it would now be planned
+            sub_batches = plan_batches([lengths[i] for i in batch], len(batch) * lengths[batch[0]],
+                                       ceiling.within(max_memory), memory)
+            batches = [[batch[i] for i in sub_batch] for sub_batch in sub_batches]
+        else:
+            batches = [batch]
+        for part in batches:
+            _forward(run, lengths, part, outputs, memory, ceiling, max_memory)
+    return outputs
+
+
+def _forward(run: Callable[[List[int]], List[Dict]], lengths: List[int], batch: List[int], outputs: List[Dict],
+             memory: Callable[[int, int], int], ceiling: _MemoryCeiling, max_memory: int):
+    try:
+        results = run(batch)
+    except (RuntimeError, MemoryError) as e:
+        if len(batch) == 1 or not is_out_of_memory(e):
+            raise
+        results = None
+    if results is None:
+        # Out of the `except` block, whose traceback holds on to the activations of the failed pass.
+        ceiling.back_off(len(batch), memory(len(batch), lengths[batch[0]]))
+        half = len(batch) // 2
+        _forward(run, lengths, batch[:half], outputs, memory, ceiling, max_memory)
+        _forward(run, lengths, batch[half:], outputs, memory, ceiling, max_memory)
+        return
+    for index, output in zip(batch, results):
+        outputs[index] = output
+    ceiling.recover(max_memory)
+
+
+def add_batch_planning_arguments(parser):
+    # Services hosted together by the gateway all ask for these.
+    if parser.get_default('max_batch_wordpieces') is not None:
+        return
+    parser.add_argument('--max-batch-wordpieces', type=int, default=8192,
+                        help='wordpieces (padding included) per forward pass of the models, sentences of similar '
+                             'lengths are batched together')
+    parser.add_argument('--max-batch-memory-mb', type=int, default=1024,
+                        help='estimated activation memory per forward pass of the models, batches that still run '
+                             'out of memory are split and retried')
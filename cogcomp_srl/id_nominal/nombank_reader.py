@@ -237,18 +237,20 @@ class NombankReader(DatasetReader):
         return data
 
     def text_to_instance(
-            self, og_tokens: List[Token], new_tokens: List[Token], pred_label: List[int] = None
+            self, og_tokens: List[Token], new_tokens: List[Token], pred_label: List[int] = None,
+            wordpieces: Tuple[List[str], List[int], List[int]] = None,
     ) -> Instance:
         """
         We take original sentence, `pre-tokenized` input as tokens here, as well as the
         tokens corresponding to once tokenized and de-hyphenated. The predicate label is 
         a binary vector, the same length as new_tokens, indicating position(s) of the
-        predicates of the sentence.
+        predicates of the sentence. `wordpieces` is the output of `_wordpiece_tokenize_input`
+        for new_tokens, if the caller already has it.
         """
         metadata_dict: Dict[str, Any] = {}
         fields: Dict[str, Field] = {}
         if self.bert_tokenizer is not None:
-            wordpieces, end_offsets, start_offsets = self._wordpiece_tokenize_input(
+            wordpieces, end_offsets, start_offsets = wordpieces or self._wordpiece_tokenize_input(
                 [t.text for t in new_tokens]
             )
             # end_offsets and start_offsets are computed to correspond to sentence with separated hyphens.
@@ -1,17 +1,20 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 import numpy
+import torch
 from overrides import overrides
 from spacy.tokens import Doc
 
-from allennlp.common.util import JsonDict, sanitize, group_by_count
+from allennlp.common.util import JsonDict
 from allennlp.predictors.predictor import Predictor
 from allennlp.data import DatasetReader, Instance
 from allennlp.models import Model
 from allennlp.data.tokenizers import Token
-from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
+from allennlp.nn.util import move_to_device
 
 from cogcomp_srl.id_nominal.nombank_reader import separate_hyphens
+from cogcomp_srl.batching import forward_in_batches, run_in_batches
+from cogcomp_srl.tokenization import SpacyTokenizer
 
 
 @Predictor.register("nombank-id")
@@ -24,7 +27,7 @@ class NominalIdPredictor(Predictor):
             self, model: Model, dataset_reader: DatasetReader, language: str = "en_core_web_sm"
     ) -> None:
         super().__init__(model, dataset_reader)
-        self._tokenizer = SpacyWordSplitter(language=language, pos_tags=True)
+        self._tokenizer = SpacyTokenizer(language=language)
 
     def predict(self, sentence: str) -> JsonDict:
         """
@@ -66,7 +69,7 @@ class NominalIdPredictor(Predictor):
         instances = self.tokens_to_instances(tokens)
 
         if not instances:
-            return sanitize({"nominals": [], "words": tokens})
+            return {"nominals": [], "words": [token.text for token in tokens]}
 
         return self.predict_instances(instances)
 
@@ -74,21 +77,66 @@ class NominalIdPredictor(Predictor):
     def _json_to_instance(self, json_dict: JsonDict):
         raise NotImplementedError("The SRL mdel uses a different API for creating instances.")
 
-    def tokens_to_instances(self, tokens):
+    def wordpieces(self, tokens) -> Optional[Tuple[List[str], List[int], List[int]]]:
         """
+        The BERT wordpieces and offsets of the de-hyphenated `tokens`, as the dataset reader
+        computes them, or `None` if the model does not use BERT.
+        """
+        if self._dataset_reader.bert_tokenizer is None:
+            return None
+        new_sentence, _ = separate_hyphens([token.text for token in tokens])
+        return self._dataset_reader._wordpiece_tokenize_input(new_sentence)
+
+    def tokens_to_instance(self, tokens, wordpieces=None) -> Instance:
+        """
+        The model tags every word of a sentence at once, so a sentence is a single instance.
+
         # Parameters
 
         tokens: `List[Token]`, required
             List of tokens of the original sentence, before hyphenated separation.
+        wordpieces: `Tuple[List[str], List[int], List[int]]`, optional
+            The output of `wordpieces(tokens)`, computed here if not given.
         """
         words = [token.text for token in tokens]
         new_sentence, new_indices = separate_hyphens(words)
         new_tokens = [Token(t) for t in new_sentence]
-        instances: List[Instance] = []
-        for i, word in enumerate(tokens):
-            instance = self._dataset_reader.text_to_instance(tokens, new_tokens)
-            instances.append(instance)
-        return instances
+        if wordpieces is None:
+            wordpieces = self.wordpieces(tokens)
+        return self._dataset_reader.text_to_instance(tokens, new_tokens, wordpieces=wordpieces)
+
+    def tokens_to_instances(self, tokens, wordpieces=None) -> List[Instance]:
+        """
+        The instance of the sentence, or none if it has no tokens.
+        """
+        return [self.tokens_to_instance(tokens, wordpieces)] if tokens else []
+
+    def tokens_to_arrays(self, tokens, wordpieces=None) -> Dict[str, list]:
+        """
+        What `tokens_to_instance` gives the model, without building an `Instance`: the BERT ids
+        of the wordpieces of the sentence, the offsets of its de-hyphenated words in them, and
+        those words. Only for models that use BERT.
+        """
+        new_sentence, _ = separate_hyphens([token.text for token in tokens])
+        wordpieces, _, start_offsets = wordpieces or self._dataset_reader._wordpiece_tokenize_input(new_sentence)
+        vocab = self._dataset_reader.bert_tokenizer.vocab
+        return {"tokens": [vocab[t] for t in wordpieces], "offsets": start_offsets, "words": new_sentence}
+
+    def forward_arrays(self, arrays: List[Dict[str, list]]) -> List[JsonDict]:
+        """
+        Runs the model on the `tokens_to_arrays` of a batch of sentences, as `forward_on_instances`
+        would on their instances: the ids are padded with 0, which the model masks like the
+        padding of the token indexer.
+        """
+        length = max(len(a["tokens"]) for a in arrays)
+        token_ids = torch.tensor([a["tokens"] + [0] * (length - len(a["tokens"])) for a in arrays])
+        metadata = [{"words": a["words"], "offsets": a["offsets"]} for a in arrays]
+        with torch.no_grad():
+            output = self._model(tokens={"tokens": move_to_device(token_ids, self._model._get_prediction_device())},
+                                 metadata=metadata)
+            output = self._model.decode(output)
+        return [{"words": words, "nominals": [int(x) for x in indicator]}
+                for words, indicator in zip(output["words"], output["predicate_indicator"])]
 
     def _sentence_to_srl_instances(self, json_dict: JsonDict) -> List[Instance]:
         """
@@ -105,7 +153,7 @@ class NominalIdPredictor(Predictor):
         # Returns
 
         instances: `List[Instance]`
-            One instance per nominal.
+            The instance of the sentence, or none if it has no tokens.
         """
         sentence = json_dict["sentence"]
         tokens = self._tokenizer.split_words(sentence)
@@ -116,33 +164,42 @@ class NominalIdPredictor(Predictor):
         """
         Perform JSON-to-JSON predition.
         """
-        batch_size = len(inputs)
-        instances_per_sentence = [self._sentence_to_srl_instances(json) for json in inputs]
-
-        flattened_instances = [
-            sentence_instances[0]
-            for sentence_instances in instances_per_sentence
-        ]
-
-        if not flattened_instances:
-            return sanitize(
-                [{"nominals": [], "words": self._tokenizer.split_words(x["sentence"])} for x in inputs]
-            )
-
-        # Batch instances and check last batch for padded elements if number of instances
-        # is not a perfect multiple of the batch size.
-        batched_instances = group_by_count(flattened_instances, batch_size, None)
-        batched_instances[-1] = [
-            instance for instance in batched_instances[-1] if instance is not None
-        ]
-        outputs: List[Dict[str, numpy.ndarray]] = []
-        for batch in batched_instances:
-            outputs.extend(self._model.forward_on_instances(batch))
+        return self.predict_batch_tokens(self._tokenizer.batch_split_words([json["sentence"] for json in inputs]))
 
-        return_dicts: List[JsonDict] = [{"words": output["words"], "nominals": output["predicate_indicator"]} for output
-                                        in outputs]
-
-        return sanitize(return_dicts)
+    def predict_batch_tokens(self, tokens_per_sentence: List[List[Token]],
+                             wordpieces_per_sentence: List[Tuple[List[str], List[int], List[int]]] = None
+                             ) -> List[JsonDict]:
+        """
+        Like `predict_batch_json`, for sentences already split into words by `self._tokenizer`,
+        and optionally their `wordpieces`. Each sentence goes straight to the model's tensors
+        with `tokens_to_arrays`, batched with others of similar lengths. Models without BERT
+        go through one instance per sentence.
+        """
+        if wordpieces_per_sentence is None:
+            wordpieces_per_sentence = [None] * len(tokens_per_sentence)
+        # Sentences without tokens have nothing to tag.
+        return_dicts: List[JsonDict] = [{"words": [], "nominals": []} for _ in tokens_per_sentence]
+        sentence_indices = [i for i, tokens in enumerate(tokens_per_sentence) if tokens]
+        if not sentence_indices:
+            return return_dicts
+
+        if self._dataset_reader.bert_tokenizer is not None:
+            arrays = [self.tokens_to_arrays(tokens_per_sentence[i], wordpieces_per_sentence[i])
+                      for i in sentence_indices]
+            results = run_in_batches(lambda batch: self.forward_arrays([arrays[i] for i in batch]),
+                                     [len(a["tokens"]) for a in arrays], self._model)
+        else:
+            instances = [self.tokens_to_instance(tokens_per_sentence[i], wordpieces_per_sentence[i])
+                         for i in sentence_indices]
+            outputs: List[Dict[str, numpy.ndarray]] = forward_in_batches(self._model, instances)
+            # `predicate_indicator` holds one 0-d tensor per word, turn them into ints here
+            # rather than walking the whole output with a recursive `sanitize`.
+            results = [{"words": output["words"], "nominals": [int(x) for x in output["predicate_indicator"]]}
+                       for output in outputs]
+
+        for i, result in zip(sentence_indices, results):
+            return_dicts[i] = result
+        return return_dicts
 
     def predict_instances(self, instances: List[Instance]) -> JsonDict:
         """ 
@@ -150,17 +207,18 @@ class NominalIdPredictor(Predictor):
         """
         outputs = self._model.forward_on_instances(instances)
 
-        results = {"nominals": outputs[0]["predicate_indicator"], "words": outputs[0]["words"]}
-        return sanitize(results)
+        results = {"nominals": [int(x) for x in outputs[0]["predicate_indicator"]], "words": outputs[0]["words"]}
+        return results
 
     @overrides
     def predict_json(self, inputs: JsonDict) -> JsonDict:
         """
         Perform JSON-to-JSON prediction. Mainly just wraps work done by other functions.
         """
-        instances = self._sentence_to_srl_instances(inputs)
+        tokens = self._tokenizer.split_words(inputs["sentence"])
+        instances = self.tokens_to_instances(tokens)
 
         if not instances:
-            return sanitize({"nominals": [], "words": self._tokenizer.split_words(inputs["sentence"])})
+            return {"nominals": [], "words": [t.text for t in tokens]}
 
-        return self.predict_instances(instances[:1])
+        return self.predict_instances(instances)
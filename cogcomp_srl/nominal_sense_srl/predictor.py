@@ -1,14 +1,15 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import numpy
 from overrides import overrides
 from spacy.tokens import Doc
-from allennlp.common.util import JsonDict, sanitize, group_by_count
+from allennlp.common.util import JsonDict
 from allennlp.predictors.predictor import Predictor
 from allennlp.data import DatasetReader, Instance
 from allennlp.models import Model
 from allennlp.data.tokenizers import Token
-from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
 from cogcomp_srl.nominal_srl.nominal_srl_reader import separate_hyphens
+from cogcomp_srl.batching import forward_in_batches
+from cogcomp_srl.tokenization import SpacyTokenizer
 
 
 @Predictor.register("nombank-sense-srl")
@@ -21,7 +22,7 @@ class NomSenseSRLPredictor(Predictor):
             self, model: Model, dataset_reader: DatasetReader, language: str = "en_core_web_sm"
     ) -> None:
         super().__init__(model, dataset_reader)
-        self._tokenizer = SpacyWordSplitter(language=language, pos_tags=True)
+        self._tokenizer = SpacyTokenizer(language=language)
 
     def predict(self, sentence: str, indices: List[int]) -> JsonDict:
         """
@@ -69,7 +70,7 @@ class NomSenseSRLPredictor(Predictor):
         instances = self.tokens_to_instances(tokens, indices)
 
         if not instances:
-            return sanitize({"nominals": [], "words": tokens})
+            return {"nominals": [], "words": [token.text for token in tokens]}
 
         return self.predict_instances(instances)
 
@@ -100,7 +101,17 @@ class NomSenseSRLPredictor(Predictor):
     def _json_to_instance(self, json_dict: JsonDict):
         raise NotImplementedError("The SRL mdel uses a different API for creating instances.")
 
-    def tokens_to_instances(self, tokens, indices):
+    def wordpieces(self, tokens) -> Optional[Tuple[List[str], List[int], List[int]]]:
+        """
+        The BERT wordpieces and offsets of the de-hyphenated `tokens`, as the dataset reader
+        computes them, or `None` if the model does not use BERT.
+        """
+        if self._dataset_reader.bert_tokenizer is None:
+            return None
+        new_sentence, _ = separate_hyphens([token.text for token in tokens])
+        return self._dataset_reader._wordpiece_tokenize_input(new_sentence)
+
+    def tokens_to_instances(self, tokens, indices, wordpieces=None):
         """
         # Parameters
 
@@ -108,17 +119,21 @@ class NomSenseSRLPredictor(Predictor):
             List of tokens of the original sentence, before hyphenated separation.
         indices: `List[int]`, required
             List of indices corresponding to the predicates to predict on.
+        wordpieces: `Tuple[List[str], List[int], List[int]]`, optional
+            The output of `wordpieces(tokens)`, computed here once for all nominals if not given.
         """
         words = [token.text for token in tokens]
         new_sentence, new_indices = separate_hyphens(words)
         new_tokens = [Token(t) for t in new_sentence]
+        if wordpieces is None and indices:
+            wordpieces = self.wordpieces(tokens)
         instances: List[Instance] = []
         for index in indices:
             new_nom_idx = new_indices[index]
             nom_labels = [0 for _ in new_tokens]
             for new_i in new_nom_idx:
                 nom_labels[new_i] = 1
-            instance = self._dataset_reader.text_to_instance(tokens, new_tokens, nom_labels)
+            instance = self._dataset_reader.text_to_instance(tokens, new_tokens, nom_labels, wordpieces=wordpieces)
             instances.append(instance)
         return instances
 
@@ -149,8 +164,24 @@ class NomSenseSRLPredictor(Predictor):
         """
         Perform JSON-to-JSON predition.
         """
-        batch_size = len(inputs)
-        instances_per_sentence = [self._sentence_to_srl_instances(json) for json in inputs]
+        return self.predict_batch_tokens(
+            self._tokenizer.batch_split_words([json["sentence"] for json in inputs]),
+            [json["indices"] for json in inputs],
+        )
+
+    def predict_batch_tokens(self, tokens_per_sentence: List[List[Token]], indices_per_sentence: List[List[int]],
+                             wordpieces_per_sentence: List[Tuple[List[str], List[int], List[int]]] = None
+                             ) -> List[JsonDict]:
+        """
+        Like `predict_batch_json`, for sentences already split into words by `self._tokenizer`,
+        and optionally their `wordpieces`.
+        """
+        if wordpieces_per_sentence is None:
+            wordpieces_per_sentence = [None] * len(tokens_per_sentence)
+        instances_per_sentence = [
+            self.tokens_to_instances(tokens, indices, wordpieces)
+            for tokens, indices, wordpieces in zip(tokens_per_sentence, indices_per_sentence, wordpieces_per_sentence)
+        ]
 
         flattened_instances = [
             instance
@@ -159,30 +190,21 @@ class NomSenseSRLPredictor(Predictor):
         ]
 
         if not flattened_instances:
-            return sanitize(
-                [{"nominals": [], "words": self._tokenizer.split_words(x["sentence"])} for x in inputs]
-            )
+            return [{"nominals": [], "words": [t.text for t in tokens]} for tokens in tokens_per_sentence]
 
-        # Batch instances and check last batch for padded elements if number of instances
-        # is not a perfect multiple of the batch size.
-        batched_instances = group_by_count(flattened_instances, batch_size, None)
-        batched_instances[-1] = [
-            instance for instance in batched_instances[-1] if instance is not None
-        ]
-        outputs: List[Dict[str, numpy.ndarray]] = []
-        for batch in batched_instances:
-            outputs.extend(self._model.forward_on_instances(batch))
+        # Run the model on batches of instances of similar lengths, the outputs come back in order.
+        outputs: List[Dict[str, numpy.ndarray]] = forward_in_batches(self._model, flattened_instances)
 
+        # Words, tags and senses are strings and the nominal indices come from instance metadata
+        # as ints, so the result is JSON-ready as is and does not need a `sanitize` pass.
         noms_per_sentence = [len(sent) for sent in instances_per_sentence]
-        return_dicts: List[JsonDict] = [{"nominals": []} for x in inputs]
+        return_dicts: List[JsonDict] = [{"nominals": []} for _ in tokens_per_sentence]
 
         output_index = 0
         for sentence_index, nom_count in enumerate(noms_per_sentence):
             if nom_count == 0:
                 # If sentence has no nominals, just return the tokenization.
-                original_text = self._tokenizer.split_words(inputs[sentence_index]["sentence"])
-
-                return_dicts[sentence_index]["words"] = original_text
+                return_dicts[sentence_index]["words"] = [t.text for t in tokens_per_sentence[sentence_index]]
                 continue
 
             for _ in range(nom_count):
@@ -197,7 +219,7 @@ class NomSenseSRLPredictor(Predictor):
                 )
                 output_index += 1
 
-        return sanitize(return_dicts)
+        return return_dicts
 
     def predict_instances(self, instances: List[Instance]) -> JsonDict:
         """ 
@@ -213,16 +235,17 @@ class NomSenseSRLPredictor(Predictor):
                 {"nominal": output["nominal"], "sense": output["sense"], "predicate_index": output["nominal_indices"],
                  "description": description, "tags": tags}
             )
-        return sanitize(results)
+        return results
 
     @overrides
     def predict_json(self, inputs: JsonDict) -> JsonDict:
         """
         Perform JSON-to-JSON prediction. Mainly just wraps work done by other functions.
         """
-        instances = self._sentence_to_srl_instances(inputs)
+        tokens = self._tokenizer.split_words(inputs["sentence"])
+        instances = self.tokens_to_instances(tokens, inputs["indices"])
 
         if not instances:
-            return sanitize({"nominals": [], "words": self._tokenizer.split_words(inputs["sentence"])})
+            return {"nominals": [], "words": [t.text for t in tokens]}
 
         return self.predict_instances(instances)
@@ -380,7 +380,7 @@ class NombankSenseSRLReader(DatasetReader):
 
     def text_to_instance(
             self, og_tokens: List[Token], new_tokens: List[Token], nom_label: List[int], new_tags: List[str] = None,
-            sense: str = None,
+            sense: str = None, wordpieces: Tuple[List[str], List[int], List[int]] = None,
     ) -> Instance:
         """
         We take original sentence, `pre-tokenized` input as tokens here, as 
@@ -389,12 +389,14 @@ class NombankSenseSRLReader(DatasetReader):
         The nom label is a [one-hot] binary vector, the same length as the 
         new_tokens, indicating the position to find arguments for. 
         The new_tags is the BIO labels for the new_tokens.
+        The wordpieces are the output of `_wordpiece_tokenize_input` for the new_tokens,
+        if the caller already has them.
 
         """
         # print('TEXT TO INSTANCE', new_tokens, ', ', nom_label, ',',  new_tags, ',', sense)
         metadata_dict: Dict[str, Any] = {}
         if self.bert_tokenizer is not None:
-            wordpieces, end_offsets, start_offsets = self._wordpiece_tokenize_input(
+            wordpieces, end_offsets, start_offsets = wordpieces or self._wordpiece_tokenize_input(
                 [t.text for t in new_tokens]
             )
             # end_offsets and start_offsets are computed to correspond to sentence with separated hyphens.
@@ -0,0 +1,103 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from allennlp.common.util import get_spacy_model
+from allennlp.data.tokenizers import Token
+
+# Defaults of every `SpacyTokenizer` created afterwards in this process, see `configure_tokenization`.
+_batch_size = 64
+_n_process = 1
+
+# language -> pool of worker processes, shared by the tokenizers of this process.
+_pools: Dict[str, ProcessPoolExecutor] = {}
+
+# The spaCy pipeline of a tokenization worker process.
+_worker_nlp = None
+
+
+def configure_tokenization(batch_size: int = 64, n_process: int = 1):
+    """
+    Sets the ``batch_size`` and ``n_process`` of the tokenizers created afterwards in this process,
+    i.e. by the predictors loaded next.
+    """
+    global _batch_size, _n_process
+    _batch_size = batch_size
+    _n_process = n_process
+
+
+def _spacy_model(language: str):
+    # The tagger is loaded, tokenizers that do not need it disable it per call, so that all the
+    # predictors of a process share this one pipeline (allennlp caches it).
+    return get_spacy_model(language, pos_tags=True, parse=False, ner=False)
+
+
+def _to_tokens(doc) -> List[Token]:
+    # What allennlp's `SpacyWordSplitter` returns: its tokens without the whitespace ones.
+    return [Token(text=t.text, idx=t.idx, lemma_=t.lemma_, pos_=t.pos_, tag_=t.tag_, dep_=t.dep_,
+                  ent_type_=t.ent_type_)
+            for t in doc if not t.is_space]
+
+
+def _init_worker(language: str):
+    global _worker_nlp
+    _worker_nlp = _spacy_model(language)
+
+
+def _split_chunk(sentences: List[str], disable: List[str], batch_size: int) -> List[List[Token]]:
+    return [_to_tokens(doc) for doc in _worker_nlp.pipe(sentences, batch_size=batch_size, disable=disable)]
+
+
+class SpacyTokenizer:
+    """
+    Splits sentences into words for the front-ends of the predictors, as allennlp's
+    ``SpacyWordSplitter`` does, with the same tokens.
+
+    Only the components a predictor needs run: the tagger with ``pos_tags``, nothing but the
+    tokenizer without. ``batch_split_words`` streams sentences through ``nlp.pipe``, ``batch_size``
+    at a time. With ``n_process > 1``, batches of more than ``batch_size`` sentences are split
+    between that many worker processes instead of running one after the other on the GIL. The
+    workers are started on the first such batch and shared by all tokenizers of the process.
+    """
+
+    def __init__(self, language: str = 'en_core_web_sm', pos_tags: bool = False,
+                 batch_size: Optional[int] = None, n_process: Optional[int] = None):
+        self.language = language
+        self.spacy = _spacy_model(language)
+        self.disable = [] if pos_tags else ['tagger']
+        self.batch_size = batch_size or _batch_size
+        self.n_process = n_process or _n_process
+
+    def split_words(self, sentence: str) -> List[Token]:
+        return _to_tokens(self.spacy(sentence, disable=self.disable))
+
+    def batch_split_words(self, sentences: List[str]) -> List[List[Token]]:
+        if self.n_process <= 1 or len(sentences) <= self.batch_size:
+            return [_to_tokens(doc) for doc in self.spacy.pipe(sentences, batch_size=self.batch_size,
+                                                                disable=self.disable)]
+        chunk_size = -(-len(sentences) // self.n_process)
+        chunks = [sentences[i:i + chunk_size] for i in range(0, len(sentences), chunk_size)]
+        results = self._pool().map(_split_chunk, chunks, [self.disable] * len(chunks),
+                                   [self.batch_size] * len(chunks))
+        return [tokens for chunk in results for tokens in chunk]
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.language not in _pools:
+            # Spawned, as forking a process that runs threads (and maybe CUDA) is not safe.
+            _pools[self.language] = ProcessPoolExecutor(
+                max_workers=self.n_process,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.language,),
+            )
+        return _pools[self.language]
+
+
+def add_tokenization_arguments(parser):
+    # Services hosted together by the gateway all ask for these.
+    if parser.get_default('spacy_processes') is not None:
+        return
+    parser.add_argument('--spacy-batch-size', type=int, default=64,
+                        help='number of sentences spaCy tokenizes at once')
+    parser.add_argument('--spacy-processes', type=int, default=1,
+                        help='tokenize large batches in this many worker processes (per inference worker)')
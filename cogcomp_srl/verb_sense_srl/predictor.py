@@ -4,12 +4,14 @@ from typing import List
 from overrides import overrides
 from spacy.tokens import Doc
 
-from allennlp.common.util import JsonDict, sanitize, group_by_count
+from allennlp.common.util import JsonDict
 from allennlp.data import DatasetReader, Instance
-from allennlp.data.tokenizers.word_splitter import SpacyWordSplitter
 from allennlp.models import Model
 from allennlp.predictors.predictor import Predictor
 
+from cogcomp_srl.batching import forward_in_batches
+from cogcomp_srl.tokenization import SpacyTokenizer
+
 
 # print("Processing time for import VERB", time() - start_time)
 
@@ -23,7 +25,7 @@ class SenseSRLPredictor(Predictor):
     def __init__(self, model: Model, dataset_reader: DatasetReader, language: str = 'en_core_web_sm') -> None:
         super().__init__(model, dataset_reader)
         # start_time = time()
-        self._tokenizer = SpacyWordSplitter(language=language, pos_tags=True)
+        self._tokenizer = SpacyTokenizer(language=language, pos_tags=True)
         # print("Processing time for init tokenizzer verb ", time() - start_time)
 
     def predict(self, sentence: str) -> JsonDict:
@@ -73,7 +75,7 @@ class SenseSRLPredictor(Predictor):
         instances = self.tokens_to_instances(tokens)
 
         if not instances:
-            return sanitize({"verbs": [], "words": tokens})
+            return {"verbs": [], "words": [token.text for token in tokens]}
 
         return self.predict_instances(instances)
 
@@ -165,31 +167,22 @@ class SenseSRLPredictor(Predictor):
                 ]}
             ]
         """
-        # For SRL, we have more instances than sentences, but the user specified
-        # a batch size with respect to the number of sentences passed, so we respect
-        # that here by taking the batch size which we use to be the number of sentences
-        # we are given.
-        batch_size = len(inputs)
-        instances_per_sentence = [self._sentence_to_srl_instances(json) for json in inputs]
+        # For SRL, we have more instances than sentences, they are batched by their
+        # number of wordpieces rather than by sentence.
+        tokens_per_sentence = self._tokenizer.batch_split_words([json["sentence"] for json in inputs])
+        instances_per_sentence = [self.tokens_to_instances(tokens) for tokens in tokens_per_sentence]
 
         flattened_instances = [instance for sentence_instances in instances_per_sentence
                                for instance in sentence_instances]
 
         if not flattened_instances:
-            return sanitize([{"verbs": [], "words": self._tokenizer.split_words(x["sentence"])}
-                             for x in inputs])
-
-        # Make the instances into batches and check the last batch for
-        # padded elements as the number of instances might not be perfectly
-        # divisible by the batch size.
-        batched_instances = group_by_count(flattened_instances, batch_size, None)
-        batched_instances[-1] = [instance for instance in batched_instances[-1]
-                                 if instance is not None]
-        # Run the model on the batches.
-        outputs = []
-        for batch in batched_instances:
-            outputs.extend(self._model.forward_on_instances(batch))
+            return [{"verbs": [], "words": [t.text for t in tokens]} for tokens in tokens_per_sentence]
+
+        # Run the model on batches of instances of similar lengths, the outputs come back in order.
+        outputs = forward_in_batches(self._model, flattened_instances)
 
+        # Every output value below is already a plain str or list of str, so the result
+        # is JSON-ready as is and does not need a `sanitize` pass.
         verbs_per_sentence = [len(sent) for sent in instances_per_sentence]
         return_dicts: List[JsonDict] = [{"verbs": []} for x in inputs]
 
@@ -197,10 +190,8 @@ class SenseSRLPredictor(Predictor):
         for sentence_index, verb_count in enumerate(verbs_per_sentence):
             if verb_count == 0:
                 # We didn't run any predictions for sentences with no verbs,
-                # so we don't have a way to extract the original sentence.
-                # Here we just tokenize the input again.
-                original_text = self._tokenizer.split_words(inputs[sentence_index]["sentence"])
-                return_dicts[sentence_index]["words"] = original_text
+                # so their words are just their tokenization.
+                return_dicts[sentence_index]["words"] = [t.text for t in tokens_per_sentence[sentence_index]]
                 continue
 
             for _ in range(verb_count):
@@ -217,7 +208,7 @@ class SenseSRLPredictor(Predictor):
                 })
                 output_index += 1
 
-        return sanitize(return_dicts)
+        return return_dicts
 
     def predict_instances(self, instances: List[Instance]) -> JsonDict:
         # start_time = time()
@@ -235,7 +226,7 @@ class SenseSRLPredictor(Predictor):
             })
 
         # print("Processing Time for verb inst", time() - start_time)
-        return sanitize(results)
+        return results
 
     @overrides
     def predict_json(self, inputs: JsonDict) -> JsonDict:
@@ -258,7 +249,7 @@ class SenseSRLPredictor(Predictor):
         instances = self._sentence_to_srl_instances(inputs)
 
         if not instances:
-            return sanitize({"verbs": [], "words": self._tokenizer.split_words(inputs["sentence"])})
+            return {"verbs": [], "words": [t.text for t in self._tokenizer.split_words(inputs["sentence"])]}
 
         # print("Processing Time for verb ", time() - start_time)
 
@@ -0,0 +1,22 @@
+import argparse
+import fasttext
+from word_vectors import export_vocab
+
+
+def main():
+    """
+    Exports the in-vocabulary vectors of a fasttext model for `serve_fasttext.py --vocab`.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--model', required=True, help='path to the fasttext model, e.g. wiki.en.bin')
+    parser.add_argument('-o', '--output', required=True, help='directory to write the vocabulary to')
+    parser.add_argument('--no-subwords', action='store_true',
+                        help='do not export the n-gram vectors; the server then needs the model for unknown words')
+    args = parser.parse_args()
+
+    print(f"Loading fasttext model now from {args.model}")
+    export_vocab(fasttext.load_model(args.model), args.output, subwords=not args.no_subwords)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import argparse
+from word_vectors import quantize_vocab
+
+
+def main():
+    """
+    Writes a compact, quantized copy of a vocabulary exported by `export_fasttext_vocab.py`, to be
+    served with `serve_fasttext.py --quantized`. Use `benchmark_fasttext_quantization.py` to compare it
+    with the full vocabulary.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--vocab', required=True, help='vocabulary exported by export_fasttext_vocab.py')
+    parser.add_argument('-o', '--output', required=True, help='directory to write the quantized vocabulary to')
+    parser.add_argument('--method', choices=['int8', 'pq'], default='int8',
+                        help='int8: one byte per value; pq: product quantization, one byte per subspace')
+    parser.add_argument('--subspaces', type=int, default=100,
+                        help='number of product quantization subspaces, which must divide the dimension')
+    args = parser.parse_args()
+
+    quantize_vocab(args.vocab, args.output, args.method, args.subspaces)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,21 @@
 import argparse
+import functools
 from aiohttp import web
 from typing import List
 import traceback
+from cogcomp_srl.batching import add_batch_planning_arguments, configure_batching
 from cogcomp_srl.id_nominal import NominalIdPredictor
 from cogcomp_srl.nominal_sense_srl import NomSenseSRLPredictor
+from cogcomp_srl.tokenization import add_tokenization_arguments, configure_tokenization
+from serving import (MicroBatcher, add_admission_arguments, add_batching_arguments, add_cache_arguments,
+                     add_executor_arguments, add_health_arguments, add_profiling_arguments, add_serialization_arguments,
+                     add_store_arguments, add_worker_arguments, admission_controlled, executor_from_args,
+                     instrument_predictor, json_response, profiled_response, sentence_warmup, serve, setup_admission,
+                     setup_cache, setup_health, setup_metrics, setup_profiling, setup_serialization, setup_store,
+                     stream_ndjson, wants_profile, wants_stream)
+
+NOM_ID_MODEL_PATH = 'checkpoints/cogcomp-nom-id.tar.gz'
+NOM_SENSE_SRL_MODEL_PATH = 'checkpoints/cogcomp-nom-sense-srl.tar.gz'
 
 routes = web.RouteTableDef()
 
@@ -17,6 +29,10 @@ class NomSRLPredictor:
                  nom_srl_predictor: NomSenseSRLPredictor):
         self.nom_id_predictor = nom_id_predictor
         self.nom_srl_predictor = nom_srl_predictor
+        # Both models usually wrap the same BERT, then the wordpieces of the first stage are
+        # reused by the second one.
+        self.share_wordpieces = same_wordpiece_tokenizer(nom_id_predictor._dataset_reader,
+                                                         nom_srl_predictor._dataset_reader)
 
     @classmethod
     def from_path(cls, nom_id_model_path: str, nom_sense_srl_model_path: str, cuda_device: int = -1):
@@ -33,27 +49,20 @@ class NomSRLPredictor:
         return cls(nom_id_predictor, nom_srl_predictor)
 
     def predict(self, sentence: str) -> dict:
-        nom_id_res = self.nom_id_predictor.predict(sentence)
-        nom_srl_res = self.nom_srl_predictor.predict(
-            sentence=sentence,
-            indices=[i for i, x in enumerate(nom_id_res['nominals']) if x == 1]
-        )
-        assert isinstance(nom_srl_res, dict)
-        return nom_srl_res
+        return self.predict_batch_json([{'sentence': sentence}])[0]
 
     def predict_batch_json(self, inputs: List[dict]) -> List[dict]:
-        nom_id_res = self.nom_id_predictor.predict_batch_json(inputs)
+        # spaCy runs once per sentence, both stages use the same tokens (and wordpieces).
+        tokens = self.nom_id_predictor._tokenizer.batch_split_words([dic['sentence'] for dic in inputs])
+        wordpieces = [self.nom_id_predictor.wordpieces(t) for t in tokens]
+        nom_id_res = self.nom_id_predictor.predict_batch_tokens(tokens, wordpieces)
         assert len(nom_id_res) == len(inputs)
 
         # The original implementation at https://github.com/CogComp/SRL-English
         # with `convert_id_to_srl_input` seems to be buggy
-        nom_srl_inputs = [{
-            'sentence': dic['sentence'],
-            'indices': [i for i, x in enumerate(res['nominals']) if x == 1],
-        } for res, dic in zip(nom_id_res, inputs)]
-        assert len(nom_srl_inputs) == len(inputs)
-
-        nom_srl_res = self.nom_srl_predictor.predict_batch_json(nom_srl_inputs)
+        indices = [[i for i, x in enumerate(res['nominals']) if x == 1] for res in nom_id_res]
+        nom_srl_res = self.nom_srl_predictor.predict_batch_tokens(
+            tokens, indices, wordpieces if self.share_wordpieces else None)
         assert len(nom_srl_res) == len(inputs)
         assert all(isinstance(d, dict) for d in nom_srl_res)
 
@@ -87,6 +96,13 @@ class NomSRLPredictor:
         return new_words, new_indices
 
 
+def same_wordpiece_tokenizer(reader, other_reader) -> bool:
+    tokenizer = getattr(reader, 'bert_tokenizer', None)
+    other_tokenizer = getattr(other_reader, 'bert_tokenizer', None)
+    return tokenizer is not None and other_tokenizer is not None and \
+        reader.lowercase_input == other_reader.lowercase_input and tokenizer.vocab == other_tokenizer.vocab
+
+
 def empty_nom_frame():
     return {
         'nominals': [],
@@ -94,49 +110,107 @@ def empty_nom_frame():
     }
 
 
+async def predict_batch(predict, params):
+    inputs = [d for d in params if d['sentence'].strip() != '']
+    predictions = await predict(inputs)
+    res = []
+    for d in params:
+        if d['sentence'].strip() == '':
+            res.append(empty_nom_frame())
+        else:
+            res.append(predictions.pop(0))
+    assert len(res) == len(params)
+    return res
+
+
 @routes.post('/cogcomp_nom_srl')
+@admission_controlled('nom_srl')
 async def handle_srl(request):
-    model = request.app['model']
+    batcher = request.app['nom_srl_batcher']
+    predict = request.app['nom_srl_predict']
     params = await request.json()
+    if wants_profile(request):
+        return await profiled_response(request, 'nom_srl', params, predict_batch)
+    if isinstance(params, list) and wants_stream(request):
+        return await stream_ndjson(request, params, functools.partial(predict_batch, predict),
+                                   chunk_size=batcher.max_batch_size)
     try:
         if isinstance(params, list):
-            inputs = [d for d in params if d['sentence'].strip() != '']
-            predictions = model.predict_batch_json(inputs)
-            res = []
-            for d in params:
-                if d['sentence'].strip() == '':
-                    res.append(empty_nom_frame())
-                else:
-                    res.append(predictions.pop(0))
-            assert len(res) == len(params)
+            res = await predict_batch(predict, params)
         else:
             if params['sentence'].strip() == '':
-                res = empty_frame()
+                res = empty_nom_frame()
             else:
-                res = model.predict(**params)
+                res = (await predict([params]))[0]
+    except web.HTTPException:
+        # e.g. the 503 of a batcher stopping with the server
+        raise
     except Exception as e:
         print(traceback.format_exc())
-        return web.json_response({'error': 'Invalid request'})
-    return web.json_response(res)
+        return json_response({'error': 'Invalid request'})
+    return json_response(res)
+
+
+def load_model(cuda_device=0, spacy_batch_size=64, spacy_processes=1, max_batch_wordpieces=8192,
+               max_batch_memory_mb=1024):
+    configure_tokenization(spacy_batch_size, spacy_processes)
+    configure_batching(max_batch_wordpieces, max_batch_memory_mb)
+    predictor = NomSRLPredictor.from_path(
+        NOM_ID_MODEL_PATH,
+        NOM_SENSE_SRL_MODEL_PATH,
+        cuda_device=cuda_device
+    )
+    instrument_predictor(predictor.nom_id_predictor, 'nom_srl.id')
+    instrument_predictor(predictor.nom_srl_predictor, 'nom_srl.srl')
+    return instrument_predictor(predictor, 'nom_srl')
+
+
+def add_arguments(parser):
+    add_tokenization_arguments(parser)
+    add_batch_planning_arguments(parser)
+
+
+def setup(app, args):
+    executor = executor_from_args(args, load_model,
+                                  (-1 if args.cpu else 0, args.spacy_batch_size, args.spacy_processes,
+                                   args.max_batch_wordpieces, args.max_batch_memory_mb))
+    batcher = MicroBatcher(functools.partial(executor.call, 'predict_batch_json'),
+                           args.max_batch_size, args.max_wait_ms, max_concurrency=executor.workers)
+    cache = setup_cache(app, 'nom_srl', args, f'{NOM_ID_MODEL_PATH}+{NOM_SENSE_SRL_MODEL_PATH}')
+    store = setup_store(app, 'nom_srl', args, [NOM_ID_MODEL_PATH, NOM_SENSE_SRL_MODEL_PATH])
+    setup_admission(app, 'nom_srl', args)
+    app['nom_srl_executor'] = executor
+    app['nom_srl_batcher'] = batcher
+    app['nom_srl_predict'] = cache.wrap(store.wrap(batcher.predict))
+    app.on_startup.append(executor.start)
+    app.on_startup.append(batcher.start)
+    app.on_cleanup.append(batcher.stop)
+    app.on_cleanup.append(executor.stop)
+    setup_health(app, 'nom_srl', args, sentence_warmup(functools.partial(executor.call, 'predict_batch_json')))
+    setup_metrics(app)
+    setup_serialization(app, args)
+    setup_profiling(app, args)
+    app.add_routes(routes)
 
 
 def main():
     parser = argparse.ArgumentParser()
+    add_arguments(parser)
     parser.add_argument('-p', '--port', default=8984)
+    add_batching_arguments(parser)
+    add_executor_arguments(parser)
+    add_admission_arguments(parser)
+    add_cache_arguments(parser)
+    add_store_arguments(parser)
+    add_health_arguments(parser)
+    add_profiling_arguments(parser)
+    add_serialization_arguments(parser)
+    add_worker_arguments(parser)
     args = parser.parse_args()
 
-    nom_id_model_path = 'checkpoints/cogcomp-nom-id.tar.gz'
-    nom_sense_srl_model_path = 'checkpoints/cogcomp-nom-sense-srl.tar.gz'
-    model = NomSRLPredictor.from_path(
-        nom_id_model_path,
-        nom_sense_srl_model_path,
-        cuda_device=0
-    )
-
     app = web.Application()
-    app['model'] = model
-    app.add_routes(routes)
-    web.run_app(app, port=args.port)
+    setup(app, args)
+    serve(app, args)
 
 
 if __name__ == '__main__':
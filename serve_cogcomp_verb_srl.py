@@ -1,7 +1,18 @@
 import argparse
+import functools
 import traceback
 from aiohttp import web
+from cogcomp_srl.batching import add_batch_planning_arguments, configure_batching
+from cogcomp_srl.tokenization import add_tokenization_arguments, configure_tokenization
 from cogcomp_srl.verb_sense_srl import SenseSRLPredictor
+from serving import (MicroBatcher, add_admission_arguments, add_batching_arguments, add_cache_arguments,
+                     add_executor_arguments, add_health_arguments, add_profiling_arguments, add_serialization_arguments,
+                     add_store_arguments, add_worker_arguments, admission_controlled, executor_from_args,
+                     instrument_predictor, json_response, profiled_response, sentence_warmup, serve, setup_admission,
+                     setup_cache, setup_health, setup_metrics, setup_profiling, setup_serialization, setup_store,
+                     stream_ndjson, wants_profile, wants_stream)
+
+MODEL_PATH = 'checkpoints/cogcomp-verb-sense-srl.tar.gz'
 
 routes = web.RouteTableDef()
 
@@ -13,48 +24,105 @@ def empty_verb_frame():
     }
 
 
+async def predict_batch(predict, params):
+    inputs = [d for d in params if d['sentence'].strip() != '']
+    predictions = await predict(inputs)
+    res = []
+    for d in params:
+        if d['sentence'].strip() == '':
+            res.append(empty_verb_frame())
+        else:
+            res.append(predictions.pop(0))
+    assert len(res) == len(params)
+    return res
+
+
 @routes.post('/cogcomp_verb_srl')
+@admission_controlled('verb_srl')
 async def handle_srl(request):
-    model = request.app['model']
+    batcher = request.app['verb_srl_batcher']
+    predict = request.app['verb_srl_predict']
     params = await request.json()
+    if wants_profile(request):
+        return await profiled_response(request, 'verb_srl', params, predict_batch)
+    if isinstance(params, list) and wants_stream(request):
+        return await stream_ndjson(request, params, functools.partial(predict_batch, predict),
+                                   chunk_size=batcher.max_batch_size)
     try:
         if isinstance(params, list):
-            inputs = [d for d in params if d['sentence'].strip() != '']
-            predictions = model.predict_batch_json(inputs)
-            res = []
-            for d in params:
-                if d['sentence'].strip() == '':
-                    res.append(empty_verb_frame())
-                else:
-                    res.append(predictions.pop(0))
-            assert len(res) == len(params)
+            res = await predict_batch(predict, params)
         else:
             if params['sentence'].strip() == '':
                 res = empty_verb_frame()
             else:
-                res = model.predict(**params)
+                res = (await predict([params]))[0]
+    except web.HTTPException:
+        # e.g. the 503 of a batcher stopping with the server
+        raise
     except Exception as e:
         print(traceback.format_exc())
-        return web.json_response({'error': 'Invalid request'})
-    return web.json_response(res)
+        return json_response({'error': 'Invalid request'})
+    return json_response(res)
+
+
+def load_model(cuda_device=0, spacy_batch_size=64, spacy_processes=1, max_batch_wordpieces=8192,
+               max_batch_memory_mb=1024):
+    configure_tokenization(spacy_batch_size, spacy_processes)
+    configure_batching(max_batch_wordpieces, max_batch_memory_mb)
+    predictor = SenseSRLPredictor.from_path(
+        MODEL_PATH,
+        predictor_name='sense-semantic-role-labeling',
+        cuda_device=cuda_device
+    )
+    return instrument_predictor(predictor, 'verb_srl')
+
+
+def add_arguments(parser):
+    add_tokenization_arguments(parser)
+    add_batch_planning_arguments(parser)
+
+
+def setup(app, args):
+    executor = executor_from_args(args, load_model,
+                                  (-1 if args.cpu else 0, args.spacy_batch_size, args.spacy_processes,
+                                   args.max_batch_wordpieces, args.max_batch_memory_mb))
+    batcher = MicroBatcher(functools.partial(executor.call, 'predict_batch_json'),
+                           args.max_batch_size, args.max_wait_ms, max_concurrency=executor.workers)
+    cache = setup_cache(app, 'verb_srl', args, MODEL_PATH)
+    store = setup_store(app, 'verb_srl', args, [MODEL_PATH])
+    setup_admission(app, 'verb_srl', args)
+    app['verb_srl_executor'] = executor
+    app['verb_srl_batcher'] = batcher
+    app['verb_srl_predict'] = cache.wrap(store.wrap(batcher.predict))
+    app.on_startup.append(executor.start)
+    app.on_startup.append(batcher.start)
+    app.on_cleanup.append(batcher.stop)
+    app.on_cleanup.append(executor.stop)
+    setup_health(app, 'verb_srl', args, sentence_warmup(functools.partial(executor.call, 'predict_batch_json')))
+    setup_metrics(app)
+    setup_serialization(app, args)
+    setup_profiling(app, args)
+    app.add_routes(routes)
 
 
 def main():
     parser = argparse.ArgumentParser()
+    add_arguments(parser)
     parser.add_argument('-p', '--port', default=8983)
+    add_batching_arguments(parser)
+    add_executor_arguments(parser)
+    add_admission_arguments(parser)
+    add_cache_arguments(parser)
+    add_store_arguments(parser)
+    add_health_arguments(parser)
+    add_profiling_arguments(parser)
+    add_serialization_arguments(parser)
+    add_worker_arguments(parser)
     args = parser.parse_args()
 
-    path = 'checkpoints/cogcomp-verb-sense-srl.tar.gz'
-    model = SenseSRLPredictor.from_path(
-        path,
-        predictor_name='sense-semantic-role-labeling',
-        cuda_device=0
-    )
-
     app = web.Application()
-    app['model'] = model
-    app.add_routes(routes)
-    web.run_app(app, port=args.port)
+    setup(app, args)
+    serve(app, args)
 
 
 if __name__ == '__main__':
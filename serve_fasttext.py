@@ -1,50 +1,363 @@
 import argparse
 import asyncio
+import functools
+import io
 import json
-from fasttext import load_model
+import fasttext
 from aiohttp import web
 import numpy as np
+from serving import (add_admission_arguments, add_executor_arguments, add_health_arguments, add_serialization_arguments,
+                     add_worker_arguments, admission_controlled, executor_from_args, json_response, register_stats,
+                     sentence_warmup, serve, setup_admission, setup_health, setup_metrics, setup_serialization)
+from word_vectors import (NeighborIndex, SIFWeights, VectorCache, Vocabulary, read_frequencies,
+                          read_frequency_list, segment_sum, tokenize)
 
 
 class WordToVectorDict:
-    def __init__(self, model):
-        self.model = model
+    """
+    Word vectors of a fasttext model. With a ``vocab`` exported by ``export_fasttext_vocab.py``,
+    in-vocabulary words are read from its memory-mapped matrix. Out-of-vocabulary words are
+    computed from its n-gram vectors if it has them, otherwise by the fasttext model, which is
+    then loaded from ``model_path`` on first use.
+
+    With a ``cache_size``, the vectors of the ``cache_size`` most recently used words are kept in
+    a ``VectorCache``. ``neighbors`` is a ``NeighborIndex`` over the words of ``vocab``, and ``sif``
+    the ``SIFWeights`` of words for sentence embeddings.
+    """
+
+    def __init__(self, model=None, vocab=None, model_path=None, cache_size=0, neighbors=None, sif=None):
+        self._model = model
+        self.vocab = vocab
+        self.model_path = model_path
+        self.neighbors = neighbors
+        self.sif = sif
+        self.cache = VectorCache(cache_size, self.dim) if cache_size > 0 else None
+
+    @property
+    def model(self):
+        if self._model is None:
+            print(f"Loading fasttext model now from {self.model_path}")
+            self._model = fasttext.load_model(self.model_path)
+        return self._model
+
+    @property
+    def dim(self):
+        return self.vocab.dim if self.vocab is not None else self.model.get_dimension()
 
     def __getitem__(self, word):
-        # Check if mean for word split needs to be done here
-        return np.mean([self.model.get_word_vector(w) for w in word.split(" ")], axis=0)
+        return self.matrix([word])[0]
+
+    def tolist(self, method, *args):
+        return getattr(self, method)(*args).tolist()
+
+    def matrix(self, tokens):
+        """
+        Returns the ``(len(tokens), dim)`` float32 matrix of the vectors of ``tokens``, where a
+        token made of several space-separated words gets the mean of their vectors. Every
+        distinct word of the batch is looked up once, and all the means are computed together
+        in one reduction.
+        """
+        _, word_vectors, word_ids, counts = self.distinct_word_vectors([token.split(" ") for token in tokens])
+        return mean_by_token(word_vectors, word_ids, counts)
+
+    def embed(self, texts, pooling='mean', cached=True):
+        """
+        Returns the ``(len(texts), dim)`` float32 embeddings of ``texts``: the mean of the vectors of
+        their words, weighted by ``self.sif`` with the ``'sif'`` pooling. Texts without words get
+        zeros. Without ``cached``, the vectors are computed past the cache, as warm-ups do.
+        """
+        if pooling not in ('mean', 'sif'):
+            raise ValueError(f'unknown pooling: {pooling}')
+        if pooling == 'sif' and self.sif is None:
+            raise ValueError('SIF pooling needs word frequencies, start the server with --word-frequencies')
+        words, word_vectors, word_ids, counts = self.distinct_word_vectors([tokenize(text) for text in texts], cached)
+        if pooling == 'sif':
+            word_vectors *= self.sif(words)[:, None]
+        sums = segment_sum(word_vectors, word_ids, counts)
+        return np.divide(sums, counts[:, None], out=sums, where=counts[:, None] > 0, casting='unsafe')
+
+    def distinct_word_vectors(self, words_per_token, cached=True):
+        """
+        Looks up the distinct words of ``words_per_token``, returning them with their vectors, the
+        row of each word of each token in those vectors, and the number of words of each token.
+        """
+        counts = np.fromiter(map(len, words_per_token), dtype=np.int64, count=len(words_per_token))
+        rows = {}  # word -> row of `word_vectors`
+        word_ids = np.fromiter((rows.setdefault(w, len(rows)) for words in words_per_token for w in words),
+                               dtype=np.int64, count=int(counts.sum()))
+        words = list(rows)
+        word_vectors = np.empty((len(words), self.dim), dtype=np.float32)
+        if cached:
+            self.fill_word_vectors(words, word_vectors)
+        else:
+            self.compute_word_vectors(words, word_vectors)
+        return words, word_vectors, word_ids, counts
+
+    def fill_word_vectors(self, words, out):
+        """Writes the vector of each of the distinct ``words`` to the same row of ``out``."""
+        if self.cache is None:
+            return self.compute_word_vectors(words, out)
+
+        slots = self.cache.get(words)
+        found = np.flatnonzero(slots >= 0)
+        out[found] = self.cache.arena[slots[found]]
+        missing = np.flatnonzero(slots < 0)
+        if len(missing):
+            missing_words = [words[i] for i in missing]
+            vectors = np.empty((len(missing), self.dim), dtype=np.float32)
+            self.compute_word_vectors(missing_words, vectors)
+            out[missing] = vectors
+            self.cache.put(missing_words, vectors)
+
+    def compute_word_vectors(self, words, out):
+        oov = range(len(words))
+        if self.vocab is not None:
+            rows = self.vocab.rows(words)
+            found = np.flatnonzero(rows >= 0)
+            out[found] = self.vocab.vectors[rows[found]]
+            oov = np.flatnonzero(rows < 0).tolist()
+            if self.vocab.subwords is not None:
+                out[oov] = self.vocab.subwords.vectors([words[i] for i in oov])
+                return
+        for i in oov:
+            out[i] = self.model.get_word_vector(words[i])
+
+    def warm_cache(self, words, batch_size=10000):
+        """Fills the cache with the vectors of ``words``, without counting them as misses."""
+        words = list(dict.fromkeys(words))[:self.cache.capacity]
+        for i in range(0, len(words), batch_size):
+            batch = words[i:i + batch_size]
+            vectors = np.empty((len(batch), self.dim), dtype=np.float32)
+            self.compute_word_vectors(batch, vectors)
+            self.cache.put(batch, vectors)
 
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def nearest(self, tokens, k=10, nprobe=None):
+        """
+        Returns the ``k`` nearest words of each of ``tokens`` with their cosine similarities, best
+        first, leaving out the token itself. With ``nprobe``, the search is approximate.
+        """
+        rows, scores = self.neighbors.search(self.matrix(tokens), k, exclude=self.vocab.rows(tokens), nprobe=nprobe)
+        return [[{'word': self.vocab.word(row), 'score': score} for row, score in zip(rows_, scores_) if row >= 0]
+                for rows_, scores_ in zip(rows.tolist(), scores.tolist())]
+
+
+def mean_by_token(word_vectors, word_ids, counts):
+    """
+    Averages ``word_vectors[word_ids]`` over consecutive runs of ``counts[i]`` words. The result
+    equals ``np.mean(..., axis=0)`` bit for bit: words are summed in order and the sums divided by
+    the integer counts.
+    """
+    sums = segment_sum(word_vectors, word_ids, counts)
+    return np.divide(sums, counts[:, None], out=sums, casting='unsafe')
+
+
+# Binary response formats, picked through the `Accept` header. Raw vectors are little-endian
+# float32 in row-major order, with their shape in the `X-Vector-Shape: <rows>,<dim>` header.
+RAW_FLOAT32 = 'application/octet-stream'
+NPY = 'application/x-npy'
 
 routes = web.RouteTableDef()
 
 
+async def vectors_response(request, method, *args):
+    """Responds with the vectors computed by ``method`` of the model, in the format asked for."""
+    executor = request.app['fasttext_executor']
+    accept = request.headers.get('Accept', '')
+    if RAW_FLOAT32 not in accept and NPY not in accept:
+        return json_response({
+            'vectors': await executor.call('tolist', method, *args)
+        })
+
+    vectors = (await executor.call(method, *args)).astype('<f4', copy=False)
+    if NPY in accept:
+        buf = io.BytesIO()
+        np.save(buf, vectors)
+        return web.Response(body=buf.getvalue(), content_type=NPY)
+    return web.Response(body=vectors.tobytes(), content_type=RAW_FLOAT32,
+                        headers={'X-Vector-Shape': ','.join(map(str, vectors.shape))})
+
+
+async def read_strings(request, field='tokens'):
+    """
+    The strings of a request, from the ``field`` query parameter of a GET request or the JSON body
+    of a POST request, either a list of strings or ``{field: [...]}``. `None` if there are none.
+    """
+    if request.method == 'POST':
+        params = await request.json()
+        strings = params.get(field) if isinstance(params, dict) else params
+    else:
+        strings = request.query.get(field)
+        strings = json.loads(strings) if strings is not None else None
+    if not isinstance(strings, list) or not all(isinstance(s, str) for s in strings):
+        return None
+    return strings
+
+
+async def tokens_size(request):
+    """
+    A list of tokens is admitted as one input, with its token count in the wordpiece slot:
+    ``--max-queued-sentences`` bounds the token lists in flight, ``--max-queued-wordpieces``
+    the tokens in them, and the ``Retry-After`` of a 429 is estimated from token lists per second.
+    """
+    try:
+        tokens = await read_strings(request)
+    except ValueError:
+        tokens = None
+    return 1, len(tokens) if tokens is not None else 0
+
+
+async def texts_size(request):
+    try:
+        texts = await read_strings(request, 'texts')
+    except ValueError:
+        texts = None
+    return (len(texts), sum(len(tokenize(text)) for text in texts)) if texts is not None else (1, 0)
+
+
 @routes.get('/fasttext')
+@admission_controlled('fasttext', tokens_size)
 async def handle_fasttext(request):
-    stov = request.app['stov']
     tokens = request.query.get('tokens')
     if tokens is None:
-        return web.json_response({'error': 'parameter `tokens` not found'})
+        return json_response({'error': 'parameter `tokens` not found'})
 
     tokens = json.loads(tokens)
-    return web.json_response({
-        'vectors': [stov[w].tolist() for w in tokens]
-    })
+    return await vectors_response(request, 'matrix', tokens)
+
+
+@routes.post('/fasttext')
+@admission_controlled('fasttext', tokens_size)
+async def handle_fasttext_batch(request):
+    try:
+        tokens = await read_strings(request)
+    except ValueError:
+        tokens = None
+    if tokens is None:
+        return json_response({'error': 'expected a list of tokens or {"tokens": [...]}'})
+    return await vectors_response(request, 'matrix', tokens)
+
+
+@routes.post('/fasttext/embed')
+@admission_controlled('fasttext', texts_size)
+async def handle_embed(request):
+    try:
+        params = await request.json()
+        texts = await read_strings(request, 'texts')
+    except ValueError:
+        params, texts = None, None
+    if texts is None:
+        return json_response({'error': 'expected a list of texts or {"texts": [...], "pooling": "mean" or "sif"}'})
+
+    pooling = params.get('pooling', 'mean') if isinstance(params, dict) else 'mean'
+    try:
+        return await vectors_response(request, 'embed', texts, pooling)
+    except ValueError as e:
+        return json_response({'error': str(e)})
+
+
+# only served with --neighbors, see setup()
+@admission_controlled('fasttext', tokens_size)
+async def handle_neighbors(request):
+    try:
+        params = await request.json()
+        tokens = await read_strings(request)
+    except ValueError:
+        params, tokens = None, None
+    if tokens is None:
+        return json_response({'error': 'expected a list of tokens or {"tokens": [...], "k": ..., "nprobe": ...}'})
+
+    options = params if isinstance(params, dict) else {}
+    k, nprobe = options.get('k', 10), options.get('nprobe')
+    if not isinstance(k, int) or k < 1 or not (nprobe is None or isinstance(nprobe, int) and nprobe >= 1):
+        return json_response({'error': '`k` and `nprobe` must be positive integers'})
+    try:
+        neighbors = await request.app['fasttext_executor'].call('nearest', tokens, k, nprobe)
+    except ValueError as e:
+        return json_response({'error': str(e)})
+    return json_response({'neighbors': neighbors})
+
+
+def load_model(path, vocab_path=None, cache_size=0, warm_path=None, neighbors_path=None, frequencies_path=None,
+               quantized=False):
+    sif = SIFWeights(dict(read_frequencies(frequencies_path))) if frequencies_path is not None else None
+    if vocab_path is not None:
+        vocab = Vocabulary(vocab_path)
+        if quantized and vocab.quantization is None:
+            raise ValueError(f'{vocab_path} is not quantized, write a quantized copy with quantize_fasttext_vocab.py')
+        print(f"Mapping fasttext vocabulary from {vocab_path}" +
+              (f" ({vocab.quantization} quantized)" if vocab.quantization else ""))
+        neighbors = NeighborIndex(neighbors_path) if neighbors_path is not None else None
+        vectors = WordToVectorDict(vocab=vocab, model_path=path, cache_size=cache_size, neighbors=neighbors, sif=sif)
+    else:
+        print(f"Loading fasttext model now from {path}")
+        vectors = WordToVectorDict(fasttext.load_model(path), cache_size=cache_size, sif=sif)
+    if vectors.cache is not None and warm_path is not None:
+        print(f"Warming the vector cache from {warm_path}")
+        vectors.warm_cache(read_frequency_list(warm_path, cache_size))
+    return vectors
+
+
+def add_arguments(parser):
+    parser.add_argument('-m', '--model', required=True, help='path to the fasttext model, e.g. wiki.en.bin')
+    parser.add_argument('--vocab', default=None,
+                        help='vocabulary exported by export_fasttext_vocab.py, to serve in-vocabulary words '
+                             'from a memory-mapped matrix and only load the model for unknown words')
+    parser.add_argument('--quantized', default=None,
+                        help='quantized vocabulary (int8 or pq) written by quantize_fasttext_vocab.py, served like '
+                             '--vocab and in its place, in a fraction of the memory')
+    parser.add_argument('--vector-cache-size', type=int, default=20000,
+                        help='number of word vectors kept in the LRU vector cache (dim * 4 bytes each), 0 to disable it')
+    parser.add_argument('--vector-cache-warm', default=None,
+                        help='frequency list of words to load into the vector cache at startup, '
+                             'one "word" or "word count" per line')
+    parser.add_argument('--neighbors', default=None,
+                        help='index built by build_fasttext_neighbors.py, to serve /fasttext/neighbors (needs --vocab)')
+    parser.add_argument('--word-frequencies', default=None,
+                        help='frequency list with one "word count" per line, for SIF-weighted /fasttext/embed')
+
+
+def setup(app, args):
+    if args.quantized is not None and args.vocab is not None:
+        raise ValueError('--quantized is served in place of --vocab, give only one of them')
+    vocab_path = args.quantized or args.vocab
+    if args.neighbors is not None and vocab_path is None:
+        raise ValueError('--neighbors needs --vocab or --quantized')
+    executor = executor_from_args(args, load_model, (args.model, vocab_path, args.vector_cache_size,
+                                                     args.vector_cache_warm, args.neighbors,
+                                                     args.word_frequencies, args.quantized is not None))
+    app['fasttext_executor'] = executor
+    if args.vector_cache_size > 0:
+        register_stats(app, 'fasttext_vectors', functools.partial(executor.call, 'cache_stats'))
+    setup_admission(app, 'fasttext', args)
+    app.on_startup.append(executor.start)
+    app.on_cleanup.append(executor.stop)
+    # The synthetic sentences must neither evict real words from the cache nor count as its misses.
+    setup_health(app, 'fasttext', args, sentence_warmup(functools.partial(executor.call, 'embed', cached=False),
+                                                      lambda sentence: sentence))
+    setup_metrics(app)
+    setup_serialization(app, args)
+    app.add_routes(routes)
+    if args.neighbors is not None:
+        app.router.add_post('/fasttext/neighbors', handle_neighbors)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-m', '--model', required=True)
+    add_arguments(parser)
     parser.add_argument('-p', '--port', default=8980)
+    add_executor_arguments(parser)
+    add_admission_arguments(parser)
+    add_health_arguments(parser)
+    add_serialization_arguments(parser)
+    add_worker_arguments(parser)
     args = parser.parse_args()
 
-    print(f"Loading fasttext model now from {args.model}")
-    model = load_model(args.model)
-    stov = WordToVectorDict(model)
-
     app = web.Application()
-    app['stov'] = stov
-    app.add_routes(routes)
-    web.run_app(app, port=args.port)
+    setup(app, args)
+    serve(app, args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+import argparse
+import importlib
+from aiohttp import web
+from serving import (add_admission_arguments, add_batching_arguments, add_cache_arguments, add_executor_arguments,
+                     add_health_arguments, add_profiling_arguments, add_serialization_arguments, add_store_arguments,
+                     add_worker_arguments, serve)
+
+# service name -> module that serves it on its own port
+SERVICES = {
+    'fasttext': 'serve_fasttext',
+    'srl': 'serve_srl',
+    'parser': 'serve_parser',
+    'verb_srl': 'serve_cogcomp_verb_srl',
+    'nom_srl': 'serve_cogcomp_nom_srl',
+    'coref': 'serve_coref',
+}
+
+
+def parse_services(value):
+    services = [s.strip() for s in value.split(',') if s.strip()]
+    unknown = [s for s in services if s not in SERVICES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown services: {", ".join(unknown)} '
+                                         f'(choose from {", ".join(SERVICES)})')
+    return services
+
+
+def main():
+    """
+    Hosts any subset of the NLP services in one process and on one port.
+
+    Models loaded together share what they can: the CogComp predictors all ask allennlp
+    for the same ``en_core_web_sm`` pipeline, which is loaded once per process, and every
+    thread executor runs on the same inference thread. The services picked together
+    must be importable from the same environment.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--services', type=parse_services, default=list(SERVICES),
+                        help=f'comma-separated services to mount (default: all of {",".join(SERVICES)})')
+    parser.add_argument('-p', '--port', default=8986)
+    add_batching_arguments(parser)
+    add_executor_arguments(parser)
+    add_admission_arguments(parser)
+    add_cache_arguments(parser)
+    add_store_arguments(parser)
+    add_health_arguments(parser)
+    add_profiling_arguments(parser)
+    add_serialization_arguments(parser)
+    add_worker_arguments(parser)
+
+    # Only import the chosen services, each one pulls in its own heavy dependencies.
+    known_args, _ = parser.parse_known_args()
+    modules = [importlib.import_module(SERVICES[name]) for name in known_args.services]
+    for module in modules:
+        if hasattr(module, 'add_arguments'):
+            module.add_arguments(parser)
+    args = parser.parse_args()
+
+    app = web.Application()
+    for module in modules:
+        module.setup(app, args)
+    serve(app, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,73 @@
 import argparse
+import functools
 import traceback
 from allennlp.predictors.predictor import Predictor
 from aiohttp import web
+from serving import (add_admission_arguments, add_cache_arguments, add_executor_arguments, add_health_arguments,
+                     add_profiling_arguments, add_serialization_arguments, add_worker_arguments, admission_controlled,
+                     executor_from_args, instrument_predictor, json_response, profiled_response, sentence_warmup, serve,
+                     setup_admission, setup_cache, setup_health, setup_metrics, setup_profiling, setup_serialization,
+                     stream_ndjson, wants_profile, wants_stream)
+
+MODEL_URL = 'https://storage.googleapis.com/allennlp-public-models/biaffine-dependency-parser-ptb-2020.04.06.tar.gz'
 
 routes = web.RouteTableDef()
 
 
 @routes.post('/parse')
+@admission_controlled('parser')
 async def handle_parse(request):
-    model = request.app['model']
+    predict = request.app['parser_predict']
     params = await request.json()
+    if wants_profile(request):
+        return await profiled_response(request, 'parser', params)
+    if isinstance(params, list) and wants_stream(request):
+        return await stream_ndjson(request, params, predict)
     try:
         if isinstance(params, list):
-            res = model.predict_batch_json(params)
+            res = await predict(params)
         else:
-            res = model.predict(**params)
+            res = (await predict([params]))[0]
     except Exception as e:
         print(traceback.format_exc())
-        return web.json_response({'error': 'Invalid request'})
-    return web.json_response(res)
+        return json_response({'error': 'Invalid request'})
+    return json_response(res)
+
+
+def load_model(cuda_device=0):
+    return instrument_predictor(Predictor.from_path(MODEL_URL, cuda_device=cuda_device), 'parser')
+
+
+def setup(app, args):
+    executor = executor_from_args(args, load_model, (-1 if args.cpu else 0,))
+    cache = setup_cache(app, 'parser', args, MODEL_URL)
+    setup_admission(app, 'parser', args)
+    app['parser_executor'] = executor
+    app['parser_predict'] = cache.wrap(functools.partial(executor.call, 'predict_batch_json'))
+    app.on_startup.append(executor.start)
+    app.on_cleanup.append(executor.stop)
+    setup_health(app, 'parser', args, sentence_warmup(functools.partial(executor.call, 'predict_batch_json')))
+    setup_metrics(app)
+    setup_serialization(app, args)
+    setup_profiling(app, args)
+    app.add_routes(routes)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--port', default=8982)
+    add_executor_arguments(parser)
+    add_admission_arguments(parser)
+    add_cache_arguments(parser)
+    add_health_arguments(parser)
+    add_profiling_arguments(parser)
+    add_serialization_arguments(parser)
+    add_worker_arguments(parser)
     args = parser.parse_args()
 
-    url = 'https://storage.googleapis.com/allennlp-public-models/biaffine-dependency-parser-ptb-2020.04.06.tar.gz'
-    model = Predictor.from_path(url, cuda_device=0)
-
     app = web.Application()
-    app['model'] = model
-    app.add_routes(routes)
-    web.run_app(app, port=args.port)
+    setup(app, args)
+    serve(app, args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,13 @@
+from serving.admission import (AdmissionController, add_admission_arguments, admission_controlled,
+                               sentence_size, setup_admission)
+from serving.batching import MicroBatcher, add_batching_arguments
+from serving.cache import ResultCache, add_cache_arguments, setup_cache
+from serving.executor import InferenceExecutor, add_executor_arguments, executor_from_args
+from serving.health import add_health_arguments, sentence_warmup, setup_health, synthetic_sentence
+from serving.metrics import instrument_predictor, setup_metrics
+from serving.prefork import add_worker_arguments, run_prefork, serve
+from serving.profiling import add_profiling_arguments, profiled_response, setup_profiling, wants_profile
+from serving.serialization import add_serialization_arguments, dumps, json_response, setup_serialization
+from serving.stats import register_stats
+from serving.store import PredictionStore, add_store_arguments, setup_store
+from serving.streaming import stream_ndjson, wants_stream
@@ -0,0 +1,139 @@
+import functools
+import json
+import math
+import re
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Optional, Tuple
+from aiohttp import web
+from serving.stats import register_stats
+
+# BERT's basic tokenization: words and single punctuation marks. Every one of them becomes
+# at least one wordpiece, which makes this a cheap lower bound on the wordpiece count.
+_BASIC_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_wordpieces(text: str) -> int:
+    return len(_BASIC_TOKEN.findall(text))
+
+
+async def sentence_size(request: web.Request, field: str = 'sentence') -> Tuple[int, int]:
+    """
+    Number of inputs and estimated wordpieces of a JSON request like ``{"sentence": "..."}``
+    or ``[{"sentence": "..."}, ...]``.
+    """
+    params = await request.json()
+    inputs = params if isinstance(params, list) else [params]
+    texts = [d.get(field) if isinstance(d, dict) else None for d in inputs]
+    return len(inputs), sum(estimate_wordpieces(t) for t in texts if isinstance(t, str))
+
+
+class AdmissionController:
+    """
+    Bounds the work a service has accepted but not finished yet: the number of requests,
+    the number of sentences and the (estimated) number of wordpieces in them. A request
+    that would go over any limit is rejected at once with ``429 Too Many Requests`` and
+    a ``Retry-After`` hint, instead of queueing until the process runs out of memory.
+    A request is always admitted when nothing else is in flight, however large it is.
+    """
+
+    def __init__(self, max_requests: Optional[int] = None, max_sentences: Optional[int] = None,
+                 max_wordpieces: Optional[int] = None):
+        self.max_requests = max_requests
+        self.max_sentences = max_sentences
+        self.max_wordpieces = max_wordpieces
+        self.requests = 0
+        self.sentences = 0
+        self.wordpieces = 0
+        self.rejected = 0
+        # exponential moving average of the sentences finished per second
+        self.throughput: Optional[float] = None
+
+    def _over_limit(self, sentences: int, wordpieces: int) -> bool:
+        if self.requests == 0:
+            return False
+        return (self.max_requests is not None and self.requests + 1 > self.max_requests) or \
+            (self.max_sentences is not None and self.sentences + sentences > self.max_sentences) or \
+            (self.max_wordpieces is not None and self.wordpieces + wordpieces > self.max_wordpieces)
+
+    def retry_after(self) -> int:
+        """
+        Seconds until the work in flight is expected to be done.
+        """
+        if not self.throughput:
+            return 1
+        return min(60, max(1, math.ceil(self.sentences / self.throughput)))
+
+    @contextmanager
+    def admit(self, sentences: int, wordpieces: int = 0):
+        if self._over_limit(sentences, wordpieces):
+            self.rejected += 1
+            raise web.HTTPTooManyRequests(
+                text=json.dumps({'error': 'Server busy'}),
+                content_type='application/json',
+                headers={'Retry-After': str(self.retry_after())},
+            )
+
+        self.requests += 1
+        self.sentences += sentences
+        self.wordpieces += wordpieces
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.requests -= 1
+            self.sentences -= sentences
+            self.wordpieces -= wordpieces
+            elapsed = time.monotonic() - start
+            if sentences and elapsed > 0:
+                rate = sentences / elapsed
+                self.throughput = rate if self.throughput is None else 0.9 * self.throughput + 0.1 * rate
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'sentences': self.sentences,
+            'wordpieces': self.wordpieces,
+            'rejected': self.rejected,
+            'throughput': self.throughput,
+            'limits': {
+                'requests': self.max_requests,
+                'sentences': self.max_sentences,
+                'wordpieces': self.max_wordpieces,
+            },
+        }
+
+
+def admission_controlled(name: str,
+                         size: Callable[[web.Request], Awaitable[Tuple[int, int]]] = sentence_size):
+    """
+    Runs the decorated handler under the admission controller ``app['<name>_admission']``.
+    ``size`` tells how many inputs and wordpieces a request holds.
+    """
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            admission = request.app[f'{name}_admission']
+            with admission.admit(*await size(request)):
+                return await handler(request)
+
+        return wrapper
+
+    return decorator
+
+
+def setup_admission(app: web.Application, name: str, args) -> AdmissionController:
+    admission = AdmissionController(args.max_requests, args.max_queued_sentences, args.max_queued_wordpieces)
+    app[f'{name}_admission'] = admission
+    register_stats(app, f'{name}_queue', admission.stats)
+    return admission
+
+
+def add_admission_arguments(parser):
+    parser.add_argument('--max-requests', type=int, default=None,
+                        help='maximum number of requests in flight before new ones get a 429')
+    parser.add_argument('--max-queued-sentences', type=int, default=None,
+                        help='maximum number of sentences in flight before new requests get a 429')
+    parser.add_argument('--max-queued-wordpieces', type=int, default=None,
+                        help='maximum number of (estimated) wordpieces in flight before new requests get a 429')
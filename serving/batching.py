@@ -0,0 +1,148 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+
+
+class MicroBatcher:
+    """
+    Gathers the sentences of concurrent requests into a single call to ``predict_batch``.
+
+    A batch is closed once it holds ``max_batch_size`` sentences or ``max_wait_ms``
+    milliseconds have passed since its first request arrived, whichever comes first.
+    Every request gets back its own slice of the predictions, in input order. A request
+    larger than ``max_batch_size`` is never split, it is just run on its own.
+
+    At most ``max_concurrency`` batches run at once. While all of them are busy, new
+    requests keep queueing up and are picked up together by the next batch. When the batcher
+    stops, requests that have not been answered yet fail with 503.
+    """
+
+    def __init__(self, predict_batch: Callable[[List[dict]], Awaitable[List[dict]]],
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0, max_concurrency: int = 1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_concurrency = max_concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._running: Optional[asyncio.Semaphore] = None
+        self._carry: Optional[Tuple[List[dict], asyncio.Future]] = None
+        # the requests of the batch being gathered, and those of each running batch
+        self._gathering: List[Tuple[List[dict], asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._batches: Dict[asyncio.Task, List[Tuple[List[dict], asyncio.Future]]] = {}
+
+    async def start(self, app=None):
+        self._queue = asyncio.Queue()
+        self._running = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, app=None):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        waiting = self._gathering + [item for pending in self._batches.values() for item in pending]
+        if self._carry is not None:
+            waiting.append(self._carry)
+        while self._queue is not None and not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        self._gathering, self._carry = [], None
+        for _, future in waiting:
+            if not future.done():
+                future.set_exception(web.HTTPServiceUnavailable(reason='Server shutting down'))
+
+        batches = list(self._batches)
+        for batch in batches:
+            batch.cancel()
+        await asyncio.gather(*batches, return_exceptions=True)
+
+    async def predict(self, inputs: List[dict]) -> List[dict]:
+        if not inputs:
+            return []
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((inputs, future))
+        return await future
+
+    async def _next_batch(self) -> List[Tuple[List[dict], asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        if self._carry is not None:
+            pending, self._carry = [self._carry], None
+        else:
+            pending = [await self._queue.get()]
+        self._gathering = pending
+        size = len(pending[0][0])
+        deadline = loop.time() + self.max_wait
+
+        while size < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                item = self._queue.get_nowait()
+            if size + len(item[0]) > self.max_batch_size:
+                self._carry = item
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    async def _run_batch(self, pending: List[Tuple[List[dict], asyncio.Future]]):
+        flattened = [d for inputs, _ in pending for d in inputs]
+        try:
+            predictions = await self.predict_batch(flattened)
+            assert len(predictions) == len(flattened)
+        except Exception as e:
+            if len(pending) > 1:
+                # Re-run the requests one by one so that a single bad request
+                # does not fail everyone it was batched with.
+                for item in pending:
+                    await self._run_batch([item])
+            else:
+                _, future = pending[0]
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        start = 0
+        for inputs, future in pending:
+            end = start + len(inputs)
+            # The client may have gone away while the batch was running.
+            if not future.done():
+                future.set_result(predictions[start:end])
+            start = end
+
+    async def _run_and_release(self, pending: List[Tuple[List[dict], asyncio.Future]]):
+        try:
+            await self._run_batch(pending)
+        finally:
+            self._running.release()
+
+    async def _run(self):
+        while True:
+            await self._running.acquire()
+            pending = await self._next_batch()
+            self._gathering = []
+            pending = [item for item in pending if not item[1].done()]
+            if pending:
+                # Keep a reference so the running batch is not garbage collected.
+                batch = asyncio.create_task(self._run_and_release(pending))
+                self._batches[batch] = pending
+                batch.add_done_callback(lambda task: self._batches.pop(task, None))
+            else:
+                self._running.release()
+
+
+def add_batching_arguments(parser):
+    parser.add_argument('--max-batch-size', type=int, default=64,
+                        help='maximum number of sentences gathered into one forward pass')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='maximum time a request waits for others to join its batch')
@@ -0,0 +1,112 @@
+import functools
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+from aiohttp import web
+from serving.stats import register_stats
+
+
+class ResultCache:
+    """
+    An LRU cache of per-sentence predictions, in front of a ``predict_batch`` function.
+
+    Entries are keyed by the model identity and the canonical JSON of the input, i.e. its
+    text and every request option. The text itself is not rewritten: spaCy tokenization
+    is whitespace-sensitive, so two sentences that differ only in spacing can get different
+    ``words`` back. Identical inputs within one batch are only predicted once.
+
+    Entries are evicted least recently used first once there are more than ``max_size``
+    of them, or once they are older than ``ttl`` seconds. A ``max_size`` of 0 disables
+    the cache.
+    """
+
+    def __init__(self, model_id: str, max_size: int = 10000, ttl: Optional[float] = None):
+        self.model_id = model_id
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+
+    def key(self, inputs: dict) -> str:
+        return self.model_id + '\0' + json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if self.ttl is not None and time.monotonic() - created > self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def predict(self, inputs: List[dict],
+                      predict_batch: Callable[[List[dict]], Awaitable[List[dict]]]) -> List[dict]:
+        if self.max_size <= 0:
+            return await predict_batch(inputs)
+
+        results = [None] * len(inputs)
+        missing = OrderedDict()  # key -> indices of the inputs waiting for it
+        for i, d in enumerate(inputs):
+            key = self.key(d)
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                results[i] = value
+            elif key in missing:
+                self.deduplicated += 1
+                missing[key].append(i)
+            else:
+                self.misses += 1
+                missing[key] = [i]
+
+        if missing:
+            predictions = await predict_batch([inputs[indices[0]] for indices in missing.values()])
+            assert len(predictions) == len(missing)
+            for (key, indices), prediction in zip(missing.items(), predictions):
+                self.put(key, prediction)
+                for i in indices:
+                    results[i] = prediction
+        return results
+
+    def wrap(self, predict_batch: Callable[[List[dict]], Awaitable[List[dict]]]):
+        return functools.partial(self.predict, predict_batch=predict_batch)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'deduplicated': self.deduplicated,
+            'evictions': self.evictions,
+        }
+
+
+def setup_cache(app: web.Application, name: str, args, model_id: str) -> ResultCache:
+    cache = ResultCache(f'{name}:{model_id}', args.cache_size, args.cache_ttl)
+    app[f'{name}_cache'] = cache
+    register_stats(app, f'{name}_cache', cache.stats)
+    return cache
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='number of predictions kept in the in-memory result cache, 0 to disable it')
+    parser.add_argument('--cache-ttl', type=float, default=None,
+                        help='seconds after which a cached prediction is evicted (default: never)')
@@ -0,0 +1,149 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional, Sequence
+from serving.metrics import drain_metrics, merge_metrics
+from serving.profiling import profile_call
+
+# The model owned by the current worker process, see `_init_worker`.
+_worker_model = None
+
+# Every thread executor in a process shares this one inference thread, so models that
+# share resources (e.g. one spaCy pipeline in the gateway) are never used concurrently.
+_inference_thread: Optional[ThreadPoolExecutor] = None
+_inference_thread_users = 0
+
+
+def _init_worker(load_model: Callable, load_args: Sequence):
+    global _worker_model
+    _worker_model = load_model(*load_args)
+
+
+def _call_worker_model(method: str, args: tuple, kwargs: dict):
+    # The metrics the model recorded in this worker travel back with the result.
+    return getattr(_worker_model, method)(*args, **kwargs), drain_metrics()
+
+
+def _profile_worker_model(method: str, args: tuple, kwargs: dict, trace_dir: Optional[str]):
+    return profile_call(_worker_model, method, args, kwargs, trace_dir), drain_metrics()
+
+
+class InferenceExecutor:
+    """
+    Runs model calls off the aiohttp event loop.
+
+    With ``kind='thread'`` the model is loaded in this process and every call runs on
+    a single dedicated inference thread, shared by all thread executors of the process.
+    allennlp predictors (e.g. ``NominalIdPredictor``, ``NomSenseSRLPredictor``) and the
+    spaCy pipelines they hold are not safe to call from several threads at once, so
+    two calls never run together.
+
+    With ``kind='process'`` each of ``workers`` processes loads its own copy of the model
+    with ``load_model(*load_args)``, so no predictor object is ever shared. ``load_model``
+    must be a module-level function so it can be sent to the workers.
+
+    At most ``max_pending`` calls are queued or running at once, later callers wait
+    for a free slot.
+    """
+
+    def __init__(self, load_model: Callable, load_args: Sequence = (), kind: str = 'thread',
+                 workers: int = 1, max_pending: int = 64):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f'unknown executor kind: {kind}')
+        if kind == 'thread' and workers != 1:
+            raise ValueError('predictors are not thread-safe, use process workers to run '
+                             'several inference workers')
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.load_model = load_model
+        self.load_args = tuple(load_args)
+        self.model = load_model(*load_args) if kind == 'thread' else None
+        self.pending = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pool: Optional[Executor] = None
+
+    async def start(self, app=None):
+        global _inference_thread, _inference_thread_users
+        self._slots = asyncio.Semaphore(self.max_pending)
+        if self.kind == 'thread':
+            if _inference_thread is None:
+                _inference_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+            _inference_thread_users += 1
+            self._pool = _inference_thread
+        else:
+            # CUDA cannot be re-initialized in a forked child, so always spawn.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.load_model, self.load_args),
+            )
+
+    async def stop(self, app=None):
+        global _inference_thread, _inference_thread_users
+        if self._pool is None:
+            return
+        if self.kind == 'thread':
+            _inference_thread_users -= 1
+            if _inference_thread_users == 0:
+                _inference_thread.shutdown(wait=True, cancel_futures=True)
+                _inference_thread = None
+        else:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        self._pool = None
+
+    async def call(self, method: str, *args, **kwargs):
+        """
+        Calls ``model.<method>(*args, **kwargs)`` on an inference worker.
+        """
+        if self.kind == 'thread':
+            fn = functools.partial(getattr(self.model, method), *args, **kwargs)
+        else:
+            fn = functools.partial(_call_worker_model, method, args, kwargs)
+        return await self._run(fn)
+
+    async def profile(self, method: str, *args, trace_dir: Optional[str] = None, **kwargs):
+        """
+        Like ``call``, but returns ``(result, profile)`` with the time the call spent in each
+        stage of the model, see ``profile_call``.
+        """
+        if self.kind == 'thread':
+            fn = functools.partial(profile_call, self.model, method, args, kwargs, trace_dir)
+        else:
+            fn = functools.partial(_profile_worker_model, method, args, kwargs, trace_dir)
+        return await self._run(fn)
+
+    async def _run(self, fn: Callable):
+        self.pending += 1
+        try:
+            async with self._slots:
+                result = await asyncio.get_running_loop().run_in_executor(self._pool, fn)
+        finally:
+            self.pending -= 1
+        if self.kind == 'process':
+            result, metrics = result
+            merge_metrics(metrics)
+        return result
+
+
+def add_executor_arguments(parser):
+    parser.add_argument('--inference-executor', choices=['thread', 'process'], default='thread',
+                        help='run inference on one dedicated thread or on a pool of worker processes')
+    parser.add_argument('--inference-workers', type=int, default=1,
+                        help='number of worker processes for the process executor')
+    parser.add_argument('--max-pending', type=int, default=64,
+                        help='maximum number of inference calls queued or running at once')
+    parser.add_argument('--cpu', action='store_true',
+                        help='run the models on CPU instead of the first GPU')
+
+
+def executor_from_args(args, load_model: Callable, load_args: Sequence = ()) -> InferenceExecutor:
+    return InferenceExecutor(
+        load_model,
+        load_args,
+        kind=args.inference_executor,
+        workers=args.inference_workers,
+        max_pending=args.max_pending,
+    )
@@ -0,0 +1,90 @@
+import asyncio
+import itertools
+import time
+import traceback
+from typing import Awaitable, Callable, Optional, Sequence
+from aiohttp import web
+
+WARMUP_WORDS = ('The company said on Monday that its chief executive would meet the regulators in '
+                'Washington to discuss the proposed acquisition of its largest competitor').split()
+WARMUP_LENGTHS = (8, 32, 96)
+WARMUP_BATCH_SIZES = (1, 16)
+
+
+def synthetic_sentence(n_words: int) -> str:
+    return ' '.join(itertools.islice(itertools.cycle(WARMUP_WORDS), n_words)) + ' .'
+
+
+def sentence_warmup(predict_batch: Callable[[list], Awaitable], make_input: Callable[[str], object] = None,
+                    lengths: Sequence[int] = WARMUP_LENGTHS, batch_sizes: Sequence[int] = WARMUP_BATCH_SIZES):
+    """
+    A warm-up that runs batches of synthetic sentences of every length and batch size through
+    ``predict_batch``, each sentence passed as ``make_input(sentence)``, ``{'sentence': sentence}``
+    by default. Call the model directly rather than through a cache, which would keep the results.
+    """
+    make_input = make_input or (lambda sentence: {'sentence': sentence})
+
+    async def warmup():
+        for length in lengths:
+            for batch_size in batch_sizes:
+                await predict_batch([make_input(synthetic_sentence(length))] * batch_size)
+
+    return warmup
+
+
+async def handle_healthz(request):
+    return web.json_response({'status': 'ok'})
+
+
+async def handle_readyz(request):
+    states = request.app['warmup']
+    ready = all(state == 'ready' for state in states.values())
+    return web.json_response({'ready': ready, 'services': states}, status=200 if ready else 503)
+
+
+def setup_health(app: web.Application, name: str, args, warmup: Optional[Callable[[], Awaitable]] = None):
+    """
+    Adds the ``GET /healthz`` endpoint, which answers as long as the server runs, and ``GET /readyz``,
+    which only answers 200 once the ``warmup`` of every service has finished, and 503 until then.
+
+    ``warmup`` runs in the background once the server has started, so call this after registering
+    the startup hooks of the models it uses. A warm-up that fails leaves the server not ready.
+    """
+    if 'warmup' not in app:
+        app['warmup'] = {}
+        app['warmup_tasks'] = []
+        app.router.add_get('/healthz', handle_healthz)
+        app.router.add_get('/readyz', handle_readyz)
+        app.on_cleanup.append(cancel_warmups)
+
+    if warmup is None or args.skip_warmup:
+        app['warmup'][name] = 'ready'
+        return
+    app['warmup'][name] = 'warming'
+
+    async def run_warmup():
+        start = time.perf_counter()
+        try:
+            await warmup()
+        except Exception:
+            print(f'warm-up of {name} failed: {traceback.format_exc()}')
+            app['warmup'][name] = 'failed'
+        else:
+            print(f'warmed up {name} in {time.perf_counter() - start:.1f}s')
+            app['warmup'][name] = 'ready'
+
+    async def start_warmup(app):
+        app['warmup_tasks'].append(asyncio.ensure_future(run_warmup()))
+
+    app.on_startup.append(start_warmup)
+
+
+async def cancel_warmups(app):
+    for task in app['warmup_tasks']:
+        task.cancel()
+    await asyncio.gather(*app['warmup_tasks'], return_exceptions=True)
+
+
+def add_health_arguments(parser):
+    parser.add_argument('--skip-warmup', action='store_true',
+                        help='report ready right away instead of after running synthetic batches through the models')
@@ -0,0 +1,295 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence
+from aiohttp import web
+from serving.admission import estimate_wordpieces
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(float(2 ** i) for i in range(17))
+
+# name -> Histogram, in the order they are exported
+_histograms: Dict[str, 'Histogram'] = {}
+
+# The stages of a profiled call, see `record_stages`.
+_recording = threading.local()
+
+
+class Histogram:
+    """
+    A Prometheus histogram with one series per combination of values of its ``labels``.
+
+    Observing takes a lock and a binary search, cheap enough to leave on in production.
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., count above the last bucket, sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        _histograms[name] = self
+
+    def observe(self, value: float, *label_values: str):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[bucket] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def drain(self) -> Dict[tuple, list]:
+        with self._lock:
+            series, self._series = self._series, {}
+        return series
+
+    def merge(self, series: Dict[tuple, list]):
+        with self._lock:
+            for label_values, values in series.items():
+                current = self._series.setdefault(label_values, [0] * len(values))
+                for i, value in enumerate(values):
+                    current[i] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, values in series:
+            labels = [f'{k}="{escape(v)}"' for k, v in zip(self.labels, label_values)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                le = 'le="{}"'.format('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f'{self.name}_bucket{selector(labels + [le])} {cumulative}')
+            lines.append(f'{self.name}_sum{selector(labels)} {values[-2]}')
+            lines.append(f'{self.name}_count{selector(labels)} {values[-1]}')
+        return lines
+
+
+def selector(labels: List[str]) -> str:
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+STAGE_SECONDS = Histogram('nlp_stage_seconds', 'Time spent in each stage of a model.', ('model', 'stage'))
+BATCH_SIZE = Histogram('nlp_batch_size', 'Inputs per batch predicted by a model.', ('model',), SIZE_BUCKETS)
+BATCH_INSTANCES = Histogram('nlp_batch_instances', 'Model instances per batch predicted by a model.', ('model',),
+                            SIZE_BUCKETS)
+BATCH_WORDPIECES = Histogram('nlp_batch_wordpieces', 'Wordpieces per batch predicted by a model, those of its '
+                             'instances or, for JSON inputs, estimated from their text.', ('model',), SIZE_BUCKETS)
+FORWARD_BATCH_SIZE = Histogram('nlp_forward_batch_size', 'Instances per forward pass of a model.', ('model',),
+                               SIZE_BUCKETS)
+FORWARD_TOKENS = Histogram('nlp_forward_tokens', 'Tokens per forward pass of a model, padding included.',
+                           ('model',), SIZE_BUCKETS)
+REQUEST_SECONDS = Histogram('nlp_request_seconds', 'Time to answer HTTP requests.', ('route', 'status'))
+SERIALIZE_SECONDS = Histogram('nlp_serialize_seconds', 'Time to encode JSON responses.')
+
+
+def drain_metrics() -> Dict[str, dict]:
+    """Returns and resets the observations of this process, to be merged into another one's."""
+    return {name: series for name, series in ((name, h.drain()) for name, h in _histograms.items()) if series}
+
+
+def merge_metrics(metrics: Dict[str, dict]):
+    for name, series in metrics.items():
+        _histograms[name].merge(series)
+
+
+@contextmanager
+def record_stages():
+    """
+    Collects the stages that run on this thread inside the ``with`` block, as a dict from
+    ``(model, stage)`` to ``[seconds, calls]`` in the order the stages were first entered.
+    """
+    stages = {}
+    _recording.stages = stages
+    try:
+        yield stages
+    finally:
+        _recording.stages = None
+
+
+def synchronize_cuda():
+    # CUDA kernels run asynchronously, wait for them so that their time is counted in the right stage
+    if torch is not None and torch.cuda.is_initialized():
+        torch.cuda.synchronize()
+
+
+def _timed(obj, method: str, model: str, stage: str, sync: bool = False, on_call=None):
+    fn = getattr(obj, method, None)
+    if fn is None:
+        return
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stages = getattr(_recording, 'stages', None)
+        if stages is not None:
+            recorded = stages.setdefault((model, stage), [0.0, 0])
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            if sync:
+                synchronize_cuda()
+        finally:
+            seconds = time.perf_counter() - start
+            STAGE_SECONDS.observe(seconds, model, stage)
+            if stages is not None:
+                recorded[0] += seconds
+                recorded[1] += 1
+        # only calls that succeeded, e.g. not the forward passes that ran out of memory and were split
+        if on_call is not None:
+            on_call(args, kwargs, result)
+        return result
+
+    setattr(obj, method, wrapper)
+
+
+def instrument_predictor(predictor, model: str):
+    """
+    Records the time ``predictor`` spends in each of its stages under ``nlp_stage_seconds``, by
+    wrapping the methods of this instance, its tokenizer, dataset reader and model:
+    ``tokenize``, building ``instances``, the model ``forward`` with the size of the batches it
+    actually runs, ``decode``, and the whole ``predict`` call with the size of its batches.
+    Stages the predictor does not have are skipped, so it also works with pipelines that only
+    have a ``predict_batch_json``. Returns ``predictor``.
+    """
+    # instances and their wordpieces built since the last batch
+    instances = [0, 0]
+
+    def count_instance(args, kwargs, instance):
+        instances[0] += 1
+        instances[1] += _instance_wordpieces(instance)
+
+    def count_arrays(args, kwargs, arrays):
+        instances[0] += 1
+        instances[1] += len(arrays['tokens'])
+
+    def count_forward(args, kwargs, output):
+        # the batch size and padded length of the first batched tensor, e.g. the token ids
+        shape = _batch_shape(list(args) + list(kwargs.values()))
+        if shape is not None:
+            FORWARD_BATCH_SIZE.observe(shape[0], model)
+            FORWARD_TOKENS.observe(shape[0] * shape[1], model)
+
+    tokenizer = getattr(predictor, '_tokenizer', None)
+    for method in ('split_words', 'batch_split_words', 'tokenize'):
+        _timed(tokenizer, method, model, 'tokenize')
+    _timed(getattr(predictor, '_dataset_reader', None), 'text_to_instance', model, 'instances',
+           on_call=count_instance)
+    # predictors that build the inputs of their model without allennlp instances
+    _timed(predictor, 'tokens_to_arrays', model, 'instances', on_call=count_arrays)
+    network = getattr(predictor, '_model', None)
+    if network is not None:
+        # torch modules call `self.forward`, so wrapping the attribute of the instance is enough
+        _timed(network, 'forward', model, 'forward', sync=True, on_call=count_forward)
+        for method in ('decode', 'make_output_human_readable'):
+            _timed(network, method, model, 'decode')
+
+    def count_batch(args, kwargs, outputs):
+        inputs = args[0] if args else next(iter(kwargs.values()))
+        BATCH_SIZE.observe(len(inputs), model)
+        if inputs and not isinstance(inputs[0], dict):
+            # sentences already split into words, whose instances hold their actual wordpieces
+            BATCH_WORDPIECES.observe(instances[1], model)
+        else:
+            BATCH_WORDPIECES.observe(sum(estimate_wordpieces(x.get('sentence') or x.get('document') or '')
+                                         for x in inputs), model)
+        if instances[0]:
+            BATCH_INSTANCES.observe(instances[0], model)
+        instances[0] = instances[1] = 0
+
+    # `predict_batch_json` of the CogComp predictors goes through `predict_batch_tokens`, which
+    # pipelines also call directly with sentences they have already tokenized.
+    predict = 'predict_batch_tokens' if hasattr(predictor, 'predict_batch_tokens') else 'predict_batch_json'
+    _timed(predictor, predict, model, 'predict', on_call=count_batch)
+    return predictor
+
+
+def _batch_shape(value):
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            shape = _batch_shape(item)
+            if shape is not None:
+                return shape
+        return None
+    shape = getattr(value, 'shape', None)
+    return tuple(shape[:2]) if shape is not None and len(shape) >= 2 else None
+
+
+def _instance_wordpieces(instance) -> int:
+    # The wordpieces of the BERT models, padding excluded, are their `tokens` field.
+    field = getattr(instance, 'fields', {}).get('tokens')
+    return field.sequence_length() if field is not None else 0
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route, str(status))
+
+
+async def handle_metrics(request):
+    lines = []
+    for histogram in _histograms.values():
+        lines.extend(histogram.render())
+    # the numbers of `GET /stats` as gauges
+    lines.append('# TYPE nlp_stat gauge')
+    for group, stats in request.app.get('stats', {}).items():
+        values = stats()
+        if inspect.isawaitable(values):
+            values = await values
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'nlp_stat{{group="{escape(group)}",key="{escape(key)}"}} {value}')
+    return web.Response(text='\n'.join(lines) + '\n', content_type='text/plain', charset='utf-8',
+                        headers={'X-Prometheus-Format': '0.0.4'})
+
+
+def setup_metrics(app: web.Application):
+    """
+    Adds the Prometheus ``GET /metrics`` endpoint to ``app``, and records the latency of its
+    requests. Models loaded by an ``InferenceExecutor`` report their stages to it, also from
+    worker processes. Pre-forked workers each keep their own metrics.
+    """
+    if 'metrics' in app:
+        return
+    app['metrics'] = True
+    app.middlewares.append(metrics_middleware)
+    app.router.add_get('/metrics', handle_metrics)
@@ -0,0 +1,125 @@
+import collections
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from aiohttp import web
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# A worker that dies is restarted after RESTART_DELAY seconds, doubled for every other
+# worker that died in the last CRASH_WINDOW seconds. After MAX_CRASHES of them, the
+# master gives up: the workers are most likely dying while starting up.
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+MAX_CRASHES = 5
+CRASH_WINDOW = 60.0
+
+
+def _run_worker(app: web.Application, sock: socket.socket, threads: int):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if torch is not None:
+        # Split the cores between the workers instead of every worker using all of them.
+        torch.set_num_threads(threads)
+    web.run_app(app, sock=sock, print=None)
+
+
+def run_prefork(app: web.Application, port, workers: int):
+    """
+    Binds ``port`` in this (master) process, then forks ``workers`` processes that all
+    accept on the same socket. Everything loaded before the fork, model weights included,
+    is shared copy-on-write: inference never writes to the weights, so their pages stay
+    shared and the model RSS is only paid once. Workers that die are replaced, with an
+    exponential backoff, and the master exits with an error once too many of them have
+    died in a short time.
+    """
+    if torch is not None and torch.cuda.is_initialized():
+        raise RuntimeError('CUDA cannot be used in forked workers, load the models with --cpu')
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('0.0.0.0', int(port)))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    # Keep the garbage collector of the workers from touching (and so copying) the
+    # pages of every object the master has loaded.
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+    crashes = collections.deque()
+    stopping = False
+
+    def fork_worker():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, threads)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f'======== Running on http://0.0.0.0:{port} with {workers} workers ========')
+    for _ in range(workers):
+        fork_worker()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if stopping:
+            continue
+        now = time.monotonic()
+        crashes.append(now)
+        while crashes[0] < now - CRASH_WINDOW:
+            crashes.popleft()
+        if len(crashes) >= MAX_CRASHES:
+            stop(None, None)
+            for pid in children:
+                os.waitpid(pid, 0)
+            sock.close()
+            sys.exit(f'{len(crashes)} workers exited in the last {CRASH_WINDOW:g}s, giving up')
+        delay = min(RESTART_DELAY * 2 ** (len(crashes) - 1), MAX_RESTART_DELAY)
+        print(f'worker {pid} exited with status {status}, restarting it in {delay:g}s')
+        # Sleep in steps so that a SIGTERM does not have to wait for the whole delay.
+        restart = now + delay
+        while not stopping and time.monotonic() < restart:
+            time.sleep(max(0.0, min(0.1, restart - time.monotonic())))
+        if not stopping:
+            fork_worker()
+    sock.close()
+
+
+def add_worker_arguments(parser):
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of pre-forked server processes sharing the port and the loaded models')
+
+
+def serve(app: web.Application, args):
+    if args.workers > 1:
+        if args.inference_executor == 'process':
+            raise ValueError('pre-forked workers share the models loaded by the master, '
+                             'use them with the thread executor')
+        run_prefork(app, args.port, args.workers)
+    else:
+        web.run_app(app, port=args.port)
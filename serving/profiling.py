@@ -0,0 +1,115 @@
+import os
+import time
+import traceback
+import uuid
+from typing import Awaitable, Callable, List, Optional
+from aiohttp import web
+from serving.metrics import SERIALIZE_SECONDS, record_stages
+from serving.serialization import dumps, json_response
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def profile_call(model, method: str, args: tuple, kwargs: dict, trace_dir: Optional[str] = None):
+    """
+    Calls ``model.<method>(*args, **kwargs)`` and returns its result with the time it spent in each
+    stage recorded by ``instrument_predictor``. With ``trace_dir``, the call also runs under
+    ``torch.profiler`` and its Chrome trace is saved in that directory.
+    """
+    trace = None
+    with record_stages() as stages:
+        start = time.perf_counter()
+        if trace_dir is None:
+            result = getattr(model, method)(*args, **kwargs)
+        else:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            with torch.profiler.profile(activities=activities, record_shapes=True) as profiler:
+                result = getattr(model, method)(*args, **kwargs)
+            trace = os.path.join(trace_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}.json')
+            profiler.export_chrome_trace(trace)
+        seconds = time.perf_counter() - start
+    return result, {
+        'seconds': seconds,
+        'stages': [{'model': model_name, 'stage': stage, 'seconds': stage_seconds, 'calls': calls}
+                   for (model_name, stage), (stage_seconds, calls) in stages.items()],
+        'trace': trace,
+    }
+
+
+def wants_profile(request: web.Request) -> bool:
+    """
+    A client asks for a profiled response with ``?profile=1`` or an ``X-Profile: 1`` header, and
+    also for a ``torch.profiler`` trace with ``trace`` instead of ``1``.
+    """
+    return _profile_flag(request) in ('1', 'true', 'trace')
+
+
+def _profile_flag(request: web.Request) -> str:
+    return (request.query.get('profile') or request.headers.get('X-Profile', '')).lower()
+
+
+async def profiled_response(request: web.Request, name: str, params,
+                            predict_batch: Optional[Callable[[Callable, List[dict]], Awaitable[List[dict]]]] = None
+                            ) -> web.Response:
+    """
+    Answers ``params`` like the handlers of ``name`` do, but runs them alone on its model, past its
+    cache and batcher, and returns ``{"result": ..., "profile": ...}``. The profile has the time
+    spent in each stage of each model, in serialization, and the whole request. ``predict_batch``
+    is the handler's own ``predict_batch(predict, inputs)``, if it has one.
+    """
+    start = time.perf_counter()
+    executor = request.app[f'{name}_executor']
+    trace_dir = None
+    if _profile_flag(request) == 'trace':
+        trace_dir = request.app.get('profile_trace_dir')
+        if trace_dir is None:
+            return json_response({'error': 'Traces are disabled, start the server with --profile-trace-dir'},
+                                 status=400)
+
+    profiles = []
+
+    async def predict(inputs):
+        result, profile = await executor.profile('predict_batch_json', inputs, trace_dir=trace_dir)
+        profiles.append(profile)
+        return result
+
+    inputs = params if isinstance(params, list) else [params]
+    try:
+        res = await (predict_batch(predict, inputs) if predict_batch is not None else predict(inputs))
+    except Exception as e:
+        print(traceback.format_exc())
+        return json_response({'error': 'Invalid request'})
+    if not isinstance(params, list):
+        res = res[0]
+
+    serialize_start = time.perf_counter()
+    body = dumps(res)
+    serialize_seconds = time.perf_counter() - serialize_start
+    SERIALIZE_SECONDS.observe(serialize_seconds)
+    profile = {
+        'seconds': time.perf_counter() - start,
+        'model_seconds': sum(p['seconds'] for p in profiles),
+        'stages': [stage for p in profiles for stage in p['stages']],
+        'serialize_seconds': serialize_seconds,
+        'traces': [p['trace'] for p in profiles if p['trace'] is not None],
+    }
+    return web.Response(body=b'{"result":' + body + b',"profile":' + dumps(profile) + b'}',
+                        content_type='application/json')
+
+
+def setup_profiling(app: web.Application, args):
+    if args.profile_trace_dir is not None:
+        if torch is None:
+            raise ValueError('--profile-trace-dir needs torch')
+        os.makedirs(args.profile_trace_dir, exist_ok=True)
+        app['profile_trace_dir'] = os.path.abspath(args.profile_trace_dir)
+
+
+def add_profiling_arguments(parser):
+    parser.add_argument('--profile-trace-dir', default=None,
+                        help='save a torch.profiler trace of requests sent with ?profile=trace in this directory')
@@ -0,0 +1,52 @@
+import json
+from aiohttp import web
+from serving.metrics import SERIALIZE_SECONDS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Whether `dumps` uses orjson, see `setup_serialization`.
+_use_orjson = False
+
+
+def _default(obj):
+    # What allennlp's `sanitize` would have turned into JSON: tensors and numpy
+    # values (`tolist`) and tokens (`text`).
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, 'text'):
+        return obj.text
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(obj) -> bytes:
+    """
+    Encodes ``obj`` as JSON bytes, the same bytes as ``json.dumps`` of what allennlp's
+    ``sanitize`` returned. With ``--orjson``, orjson encodes them instead: the same JSON
+    values, except NaN and infinities which become ``null``, written without spaces after
+    separators, with non-ASCII characters unescaped and float32 values with their shortest
+    float32 representation.
+    """
+    if _use_orjson:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default).encode()
+
+
+def json_response(data, status: int = 200) -> web.Response:
+    with SERIALIZE_SECONDS.time():
+        body = dumps(data)
+    return web.Response(body=body, status=status, content_type='application/json', charset='utf-8')
+
+
+def setup_serialization(app: web.Application, args):
+    global _use_orjson
+    if args.orjson and orjson is None:
+        raise ValueError('--orjson needs orjson, pip install orjson')
+    _use_orjson = args.orjson
+
+
+def add_serialization_arguments(parser):
+    parser.add_argument('--orjson', action='store_true',
+                        help='encode responses with orjson: faster, but not byte-identical to the json module')
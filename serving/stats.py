@@ -0,0 +1,23 @@
+import inspect
+from typing import Awaitable, Callable, Union
+from aiohttp import web
+
+
+async def handle_stats(request):
+    results = {}
+    for name, stats in request.app['stats'].items():
+        results[name] = stats()
+        if inspect.isawaitable(results[name]):
+            results[name] = await results[name]
+    return web.json_response(results)
+
+
+def register_stats(app: web.Application, name: str, stats: Callable[[], Union[dict, Awaitable[dict]]]):
+    """
+    Publishes ``stats()`` under ``name`` on the ``GET /stats`` endpoint of ``app``. ``stats`` may
+    be a coroutine function, e.g. to ask a model behind an ``InferenceExecutor``.
+    """
+    if 'stats' not in app:
+        app['stats'] = {}
+        app.router.add_get('/stats', handle_stats)
+    app['stats'][name] = stats
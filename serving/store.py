@@ -0,0 +1,199 @@
+import asyncio
+import functools
+import hashlib
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+from aiohttp import web
+from serving.stats import register_stats
+
+
+def checkpoint_hash(*paths: str) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class PredictionStore:
+    """
+    A persistent store of completed predictions in a local SQLite database, in front of a
+    ``predict_batch`` function. All server processes of a host can share one database
+    file, and it survives restarts.
+
+    Predictions are stored under their ``service`` and the hash of its ``checkpoint``, and
+    ``prune_store`` drops those of the older checkpoints of a service. Lookups run on the
+    store's own thread and new predictions are written in batches by a background task, so
+    the event loop never waits on SQLite. With no ``path`` the store is disabled and just
+    calls ``predict_batch``.
+    """
+
+    def __init__(self, path: Optional[str], service: str, checkpoint: Optional[str] = None,
+                 flush_interval: float = 0.5, flush_size: int = 256):
+        self.path = path
+        self.service = service
+        self.checkpoint = checkpoint
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._pending: Dict[str, dict] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._thread: Optional[ThreadPoolExecutor] = None
+        self._flushed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _open(self):
+        self._db = _connect(self.path)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, dict]:
+        found = {}
+        # stay well below SQLite's limit on the number of query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._db.execute(
+                'SELECT key, value FROM predictions WHERE service = ? AND checkpoint = ? '
+                f'AND key IN ({",".join("?" * len(chunk))})',
+                [self.service, self.checkpoint] + chunk,
+            )
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def _write(self, items: Dict[str, dict]):
+        self._db.executemany(
+            'INSERT OR REPLACE INTO predictions (service, checkpoint, key, value) VALUES (?, ?, ?, ?)',
+            [(self.service, self.checkpoint, key, json.dumps(value)) for key, value in items.items()],
+        )
+        self._db.commit()
+
+    async def _run_in_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._thread, fn, *args)
+
+    async def start(self, app=None):
+        if self.path is None:
+            return
+        # sqlite3 connections must stay on the thread that opened them.
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prediction-store')
+        await self._run_in_thread(self._open)
+        self._flushed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, app=None):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self._flush()
+        await self._run_in_thread(self._db.close)
+        self._thread.shutdown()
+        self._task = None
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        items, self._pending = self._pending, {}
+        await self._run_in_thread(self._write, items)
+        self.writes += len(items)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flushed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flushed.clear()
+            try:
+                await self._flush()
+            except sqlite3.Error as e:
+                print(f'failed to write predictions to {self.path}: {e}')
+
+    @staticmethod
+    def key(inputs: dict) -> str:
+        return json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+
+    async def predict(self, inputs: List[dict],
+                      predict_batch: Callable[[List[dict]], Awaitable[List[dict]]]) -> List[dict]:
+        if self.path is None:
+            return await predict_batch(inputs)
+
+        keys = [self.key(d) for d in inputs]
+        found = await self._run_in_thread(self._lookup, list(set(keys)))
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        self.hits += len(inputs) - len(missing)
+        self.misses += len(missing)
+
+        results = [found.get(key) for key in keys]
+        if missing:
+            predictions = await predict_batch([inputs[i] for i in missing])
+            assert len(predictions) == len(missing)
+            for i, prediction in zip(missing, predictions):
+                results[i] = prediction
+                self._pending[keys[i]] = prediction
+            if len(self._pending) >= self.flush_size:
+                self._flushed.set()
+        return results
+
+    def wrap(self, predict_batch: Callable[[List[dict]], Awaitable[List[dict]]]):
+        return functools.partial(self.predict, predict_batch=predict_batch)
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'service': self.service,
+            'checkpoint': self.checkpoint,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'pending_writes': len(self._pending),
+        }
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=30)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('CREATE TABLE IF NOT EXISTS predictions ('
+               'service TEXT NOT NULL, checkpoint TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+               'PRIMARY KEY (service, checkpoint, key)) WITHOUT ROWID')
+    db.commit()
+    return db
+
+
+def prune_store(path: str, service: str, checkpoint: str):
+    """
+    Drops the predictions of ``service`` stored for other checkpoints than ``checkpoint``. Run it
+    once per server, before it forks workers that write to the store.
+    """
+    db = _connect(path)
+    try:
+        db.execute('DELETE FROM predictions WHERE service = ? AND checkpoint != ?', (service, checkpoint))
+        db.commit()
+    finally:
+        db.close()
+
+
+def setup_store(app: web.Application, name: str, args, checkpoints: Sequence[str]) -> PredictionStore:
+    checkpoint = None
+    if args.store:
+        checkpoint = checkpoint_hash(*checkpoints)
+        # `setup` runs in the master, before `serve` forks the workers.
+        prune_store(args.store, name, checkpoint)
+    store = PredictionStore(args.store, name, checkpoint)
+    app[f'{name}_store'] = store
+    app.on_startup.append(store.start)
+    app.on_cleanup.append(store.stop)
+    register_stats(app, f'{name}_store', store.stats)
+    return store
+
+
+def add_store_arguments(parser):
+    parser.add_argument('--store', default=None,
+                        help='SQLite file keeping completed predictions across restarts, '
+                             'shared by all the servers of the host (default: disabled)')
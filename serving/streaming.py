@@ -0,0 +1,62 @@
+import asyncio
+import traceback
+from typing import Awaitable, Callable, List
+from aiohttp import web
+from serving.serialization import dumps
+
+NDJSON = 'application/x-ndjson'
+
+
+def wants_stream(request: web.Request) -> bool:
+    """
+    A client asks for a streamed response with ``?stream=1`` or ``Accept: application/x-ndjson``.
+    """
+    return request.query.get('stream', '').lower() in ('1', 'true') or \
+        NDJSON in request.headers.get('Accept', '')
+
+
+async def stream_ndjson(request: web.Request, inputs: List[dict],
+                        predict_chunk: Callable[[List[dict]], Awaitable[List[dict]]],
+                        chunk_size: int = 32) -> web.StreamResponse:
+    """
+    Writes one JSON line per input, in input order, as soon as the chunk of ``chunk_size``
+    inputs it belongs to is predicted. The next chunk is already running while the current
+    one is written out. If a chunk fails, an ``{"error": ...}`` line ends the stream.
+    """
+    response = web.StreamResponse(headers={'Content-Type': NDJSON})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    chunks = [inputs[i:i + chunk_size] for i in range(0, len(inputs), chunk_size)]
+    task = None
+    next_task = asyncio.ensure_future(predict_chunk(chunks[0])) if chunks else None
+    try:
+        for i in range(len(chunks)):
+            task = next_task
+            next_task = asyncio.ensure_future(predict_chunk(chunks[i + 1])) if i + 1 < len(chunks) else None
+            try:
+                predictions = await task
+            except Exception:
+                print(traceback.format_exc())
+                await response.write(dumps({'error': 'Invalid request'}) + b'\n')
+                break
+            await response.write(b''.join(dumps(p) + b'\n' for p in predictions))
+    finally:
+        # The chunk prefetched (or awaited) when the stream ends early, e.g. because the client
+        # went away, must not keep running nor leave its exception unretrieved.
+        for pending in (task, next_task):
+            if pending is None:
+                continue
+            if pending.done():
+                _retrieve(pending)
+            else:
+                pending.cancel()
+                pending.add_done_callback(_retrieve)
+
+    await response.write_eof()
+    return response
+
+
+def _retrieve(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,75 @@
+import json
+import math
+import unittest
+from unittest import mock
+from aiohttp import web
+from serving.admission import AdmissionController, estimate_wordpieces
+
+
+class AdmissionTestcase(unittest.TestCase):
+    def test_first_request_always_admitted(self):
+        admission = AdmissionController(max_requests=1, max_sentences=1, max_wordpieces=1)
+        with admission.admit(100, 1000):
+            self.assertEqual((admission.requests, admission.sentences, admission.wordpieces), (1, 100, 1000))
+        self.assertEqual((admission.requests, admission.sentences, admission.wordpieces), (0, 0, 0))
+
+    def test_over_limit(self):
+        for limits, size in [({'max_requests': 1}, (1, 1)),
+                             ({'max_sentences': 10}, (6, 0)),
+                             ({'max_wordpieces': 100}, (1, 60))]:
+            with self.subTest(**limits):
+                admission = AdmissionController(**limits)
+                with admission.admit(5, 50):
+                    self.assertTrue(admission._over_limit(*size))
+                self.assertFalse(admission._over_limit(*size))
+
+    def test_under_limit(self):
+        admission = AdmissionController(max_requests=3, max_sentences=10, max_wordpieces=100)
+        with admission.admit(5, 50), admission.admit(5, 50):
+            self.assertEqual(admission.requests, 2)
+        self.assertEqual(admission.rejected, 0)
+
+    def test_rejected_with_429(self):
+        admission = AdmissionController(max_sentences=10)
+        with admission.admit(8):
+            with self.assertRaises(web.HTTPTooManyRequests) as raised:
+                with admission.admit(3):
+                    self.fail('admitted over the limit')
+        response = raised.exception
+        self.assertEqual(response.status, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(json.loads(response.text), {'error': 'Server busy'})
+        self.assertEqual(admission.rejected, 1)
+        self.assertEqual((admission.requests, admission.sentences), (0, 0))
+
+    def test_retry_after_from_throughput(self):
+        admission = AdmissionController()
+        self.assertEqual(admission.retry_after(), 1)
+        # 20 sentences done in 2 seconds
+        with mock.patch('serving.admission.time.monotonic', side_effect=[0.0, 2.0]):
+            with admission.admit(20):
+                pass
+        self.assertEqual(admission.throughput, 10)
+
+        admission.max_sentences = 100
+        with admission.admit(95):
+            self.assertEqual(admission.retry_after(), math.ceil(95 / 10))
+            with self.assertRaises(web.HTTPTooManyRequests) as raised:
+                with admission.admit(10):
+                    pass
+            self.assertEqual(raised.exception.headers['Retry-After'], '10')
+
+    def test_retry_after_bounds(self):
+        admission = AdmissionController()
+        admission.throughput = 1000
+        admission.sentences = 1
+        self.assertEqual(admission.retry_after(), 1)
+        admission.throughput = 0.01
+        self.assertEqual(admission.retry_after(), 60)
+
+    def test_estimate_wordpieces(self):
+        self.assertEqual(estimate_wordpieces("Twitter confirms sale for $44 billion."), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
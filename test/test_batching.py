@@ -0,0 +1,102 @@
+import unittest
+
+try:
+    from cogcomp_srl import batching
+except ImportError:
+    batching = None
+
+
+class Field:
+    def __init__(self, length):
+        self.length = length
+
+    def sequence_length(self):
+        return self.length
+
+
+class Instance:
+    def __init__(self, length):
+        self.fields = {'tokens': Field(length)}
+
+
+class FakeModel:
+    """
+    Returns the length of each instance, and runs out of memory on batches whose estimated
+    activations are over ``limit``, like a GPU another process is using.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.batch_sizes = []
+
+    def forward_on_instances(self, instances):
+        lengths = [instance.fields['tokens'].length for instance in instances]
+        if batching.activation_bytes(len(lengths), max(lengths)) > self.limit:
+            raise RuntimeError('CUDA out of memory. Tried to allocate 20.00 MiB')
+        self.batch_sizes.append(len(lengths))
+        return [{'length': length} for length in lengths]
+
+
+@unittest.skipIf(batching is None, 'needs torch and allennlp')
+class BatchingTestcase(unittest.TestCase):
+    def setUp(self):
+        batching.configure_batching(max_tokens=8192, max_memory_mb=1024)
+
+    def tearDown(self):
+        batching.configure_batching()
+
+    def test_plan_within_budgets(self):
+        lengths = [5, 300, 40, 40, 512, 7, 128] * 20
+        memory = 64 * 2 ** 20
+        batches = batching.plan_batches(lengths, 2048, memory)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+        for batch in batches:
+            longest = max(lengths[i] for i in batch)
+            if len(batch) > 1:
+                self.assertLessEqual(len(batch) * longest, 2048)
+                self.assertLessEqual(batching.activation_bytes(len(batch), longest), memory)
+
+    def test_split_on_out_of_memory_then_recover(self):
+        instances = [Instance(128) for _ in range(64)]
+        model = FakeModel(limit=batching.activation_bytes(8, 128))
+        outputs = batching.forward_in_batches(model, instances)
+        self.assertEqual([output['length'] for output in outputs], [128] * 64)
+        self.assertLessEqual(max(model.batch_sizes), 8)
+        self.assertIsNotNone(batching._ceiling(model).memory)
+
+        # The memory is back: the ceiling doubles every `RECOVERY_PASSES` passes, up to the budget.
+        model.limit = float('inf')
+        for _ in range(200):
+            batching.forward_in_batches(model, instances)
+            if batching._ceiling(model).memory is None:
+                break
+        self.assertIsNone(batching._ceiling(model).memory)
+        model.batch_sizes = []
+        batching.forward_in_batches(model, instances)
+        self.assertEqual(model.batch_sizes, [64])
+
+    def test_ceiling_is_per_model(self):
+        instances = [Instance(128) for _ in range(64)]
+        starved = FakeModel(limit=batching.activation_bytes(8, 128))
+        batching.forward_in_batches(starved, instances)
+        self.assertIsNotNone(batching._ceiling(starved).memory)
+
+        # another model of the process, e.g. hosted by the same gateway, keeps its budget
+        other = FakeModel(limit=float('inf'))
+        batching.forward_in_batches(other, instances)
+        self.assertIsNone(batching._ceiling(other).memory)
+        self.assertEqual(other.batch_sizes, [64])
+
+    def test_other_errors_are_raised(self):
+        class BrokenModel:
+            def forward_on_instances(self, instances):
+                raise RuntimeError('size mismatch')
+
+        model = BrokenModel()
+        with self.assertRaises(RuntimeError):
+            batching.forward_in_batches(model, [Instance(10), Instance(12)])
+        self.assertIsNone(batching._ceiling(model).memory)
+
+    def test_single_instance_out_of_memory_is_raised(self):
+        with self.assertRaises(RuntimeError):
+            batching.forward_in_batches(FakeModel(limit=0), [Instance(10)])
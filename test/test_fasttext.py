@@ -0,0 +1,36 @@
+import json
+import unittest
+import numpy as np
+import requests
+from clients import WebFastText
+
+
+class FastTextTestcase(unittest.TestCase):
+    tokens = ['apple', 'asdf@andrew.cmu.edu']
+
+    def setUp(self):
+        self.client = WebFastText()
+
+    def test_get_vectors(self):
+        vectors = self.client.get_vectors(self.tokens)
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertEqual(vectors.shape, (2, 300))
+
+    def test_binary_matches_json(self):
+        resp = requests.get(self.client.url, params={'tokens': json.dumps(self.tokens)}).json()
+        np.testing.assert_array_equal(self.client.get_vectors(self.tokens),
+                                      np.array(resp['vectors'], dtype=np.float32))
+
+    def test_post_matches_get(self):
+        tokens = self.tokens + ['new york', 'apple']
+        get = requests.get(self.client.url, params={'tokens': json.dumps(tokens)}).json()
+        post = requests.post(self.client.url, json={'tokens': tokens}).json()
+        self.assertEqual(get, post)
+
+    def test_embed(self):
+        embeddings = self.client.embed(['An apple.', 'asdf@andrew.cmu.edu'])
+        np.testing.assert_array_equal(embeddings, self.client.get_vectors(['An apple', 'asdf@andrew.cmu.edu']))
+
+
+if __name__ == '__main__':
+    unittest.main()
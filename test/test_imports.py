@@ -0,0 +1,32 @@
+import ast
+import glob
+import importlib
+import os
+import unittest
+import serving
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(ROOT, 'serve_*.py')))
+
+
+class ImportTestcase(unittest.TestCase):
+    def test_serving_names_exist(self):
+        # Checked without importing the servers, which need their models' dependencies.
+        for name in SERVERS:
+            with open(os.path.join(ROOT, name + '.py')) as f:
+                tree = ast.parse(f.read())
+            for node in ast.walk(tree):
+                if isinstance(node, ast.ImportFrom) and node.module == 'serving':
+                    for alias in node.names:
+                        with self.subTest(server=name, name=alias.name):
+                            self.assertTrue(hasattr(serving, alias.name))
+
+    def test_import_servers(self):
+        for name in SERVERS:
+            with self.subTest(server=name):
+                try:
+                    importlib.import_module(name)
+                except ModuleNotFoundError as e:
+                    if os.path.exists(os.path.join(ROOT, e.name.split('.')[0])):
+                        raise
+                    self.skipTest(f'{name} needs {e.name}')
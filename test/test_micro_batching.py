@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from aiohttp import web
+from serving.batching import MicroBatcher
+
+
+class FakePredictor:
+    """
+    Echoes each sentence back, records the size of every batch, and fails batches
+    holding a sentence marked ``bad``.
+    """
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.batches = []
+
+    async def __call__(self, inputs):
+        self.batches.append(len(inputs))
+        await asyncio.sleep(self.delay)
+        if any(d.get('bad') for d in inputs):
+            raise ValueError('bad sentence')
+        return [{'echo': d['sentence']} for d in inputs]
+
+
+def sentences(*names):
+    return [{'sentence': name} for name in names]
+
+
+class MicroBatcherTestcase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.batchers = []
+
+    async def asyncTearDown(self):
+        for batcher in self.batchers:
+            await asyncio.wait_for(batcher.stop(), 1)
+
+    async def start(self, predict_batch, **kwargs):
+        batcher = MicroBatcher(predict_batch, **kwargs)
+        await batcher.start()
+        self.batchers.append(batcher)
+        return batcher
+
+    async def test_batch_closes_at_max_batch_size(self):
+        predictor = FakePredictor()
+        batcher = await self.start(predictor, max_batch_size=4, max_wait_ms=60000)
+        first = asyncio.ensure_future(batcher.predict(sentences('a', 'b')))
+        second = asyncio.ensure_future(batcher.predict(sentences('c', 'd')))
+        third = asyncio.ensure_future(batcher.predict(sentences('e')))
+        # Well before the deadline: the batch is full.
+        results = await asyncio.wait_for(asyncio.gather(first, second), 1)
+        self.assertEqual(results, [[{'echo': 'a'}, {'echo': 'b'}], [{'echo': 'c'}, {'echo': 'd'}]])
+        self.assertEqual(predictor.batches, [4])
+        self.assertFalse(third.done())
+        await batcher.stop()
+        with self.assertRaises(web.HTTPServiceUnavailable):
+            await asyncio.wait_for(third, 1)
+
+    async def test_batch_closes_at_max_wait(self):
+        predictor = FakePredictor()
+        batcher = await self.start(predictor, max_batch_size=64, max_wait_ms=20)
+        results = await asyncio.wait_for(asyncio.gather(batcher.predict(sentences('a')),
+                                                        batcher.predict(sentences('b', 'c'))), 1)
+        self.assertEqual(results, [[{'echo': 'a'}], [{'echo': 'b'}, {'echo': 'c'}]])
+        self.assertEqual(predictor.batches, [3])
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(await asyncio.wait_for(batcher.predict(sentences('d')), 1), [{'echo': 'd'}])
+        self.assertEqual(predictor.batches, [3, 1])
+
+    async def test_large_request_runs_alone(self):
+        predictor = FakePredictor()
+        batcher = await self.start(predictor, max_batch_size=2, max_wait_ms=20)
+        small = asyncio.ensure_future(batcher.predict(sentences('a')))
+        large = asyncio.ensure_future(batcher.predict(sentences('b', 'c', 'd', 'e', 'f')))
+        self.assertEqual(await asyncio.wait_for(small, 1), [{'echo': 'a'}])
+        self.assertEqual(await asyncio.wait_for(large, 1), [{'echo': name} for name in 'bcdef'])
+        self.assertEqual(predictor.batches, [1, 5])
+
+    async def test_failing_request_does_not_fail_its_neighbours(self):
+        predictor = FakePredictor()
+        batcher = await self.start(predictor, max_batch_size=64, max_wait_ms=20)
+        good = asyncio.ensure_future(batcher.predict(sentences('a', 'b')))
+        bad = asyncio.ensure_future(batcher.predict([{'sentence': 'c', 'bad': True}]))
+        other = asyncio.ensure_future(batcher.predict(sentences('d')))
+        await asyncio.wait_for(asyncio.wait([good, bad, other]), 1)
+        self.assertEqual(good.result(), [{'echo': 'a'}, {'echo': 'b'}])
+        self.assertEqual(other.result(), [{'echo': 'd'}])
+        with self.assertRaises(ValueError):
+            bad.result()
+        # the whole batch once, then each request on its own
+        self.assertEqual(predictor.batches, [4, 2, 1, 1])
+
+    async def test_stop_fails_in_flight_requests(self):
+        predictor = FakePredictor(delay=60)
+        batcher = await self.start(predictor, max_batch_size=1, max_wait_ms=0, max_concurrency=1)
+        running = asyncio.ensure_future(batcher.predict(sentences('a')))
+        queued = asyncio.ensure_future(batcher.predict(sentences('b')))
+        while not predictor.batches:
+            await asyncio.sleep(0.001)
+        await asyncio.wait_for(batcher.stop(), 1)
+        for future in running, queued:
+            with self.assertRaises(web.HTTPServiceUnavailable):
+                await asyncio.wait_for(future, 1)
+        self.assertEqual(predictor.batches, [1])
+        self.assertEqual(batcher._batches, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from word_vectors import NeighborIndex, build_neighbor_index
+
+
+class MatrixVocab:
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.dim = vectors.shape[1]
+
+    def __len__(self):
+        return len(self.vectors)
+
+
+class NeighborIndexTestcase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        cls.vectors = rng.standard_normal((300, 8)).astype(np.float32)
+        cls.queries = rng.standard_normal((7, 8)).astype(np.float32)
+        cls.path = os.path.join(cls.dir.name, 'neighbors')
+        build_neighbor_index(MatrixVocab(cls.vectors), cls.path, lists=6, sample_size=16, block_size=128)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def brute_force(self, queries, k, exclude):
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        scores = (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ normalized.T
+        for i, row in enumerate(exclude):
+            if row >= 0:
+                scores[i, row] = -np.inf
+        rows = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        return rows, np.take_along_axis(scores, rows, 1)
+
+    def assertSearch(self, index, k, exclude=None, nprobe=None):
+        rows, scores = index.search(self.queries, k, exclude, nprobe)
+        expected_rows, expected_scores = self.brute_force(self.queries, k, exclude if exclude is not None else
+                                                          np.full(len(self.queries), -1))
+        self.assertEqual(rows.tolist(), expected_rows.tolist())
+        self.assertTrue(np.allclose(scores, expected_scores, atol=1e-5))
+
+    def test_exact_across_blocks(self):
+        for block_size in 1000, 64, 37:
+            with self.subTest(block_size=block_size):
+                index = NeighborIndex(self.path, block_size=block_size)
+                for k in 1, 10, 100:
+                    self.assertSearch(index, k)
+
+    def test_exact_excludes_rows(self):
+        index = NeighborIndex(self.path, block_size=64)
+        # rows in different blocks, on block boundaries, and none
+        exclude = np.array([0, 63, 64, 127, 299, -1, 150])
+        self.assertSearch(index, 10, exclude)
+        rows, _ = index.search(self.vectors[exclude[:5]], 1, exclude[:5])
+        self.assertFalse(np.any(rows[:, 0] == exclude[:5]))
+
+    def test_all_lists_same_as_exact(self):
+        index = NeighborIndex(self.path, block_size=64)
+        self.assertEqual(index.meta['lists'], 6)
+        exclude = np.array([3, -1, 64, 10, -1, 200, 299])
+        for k in 1, 10:
+            exact_rows, exact_scores = index.search(self.queries, k, exclude)
+            rows, scores = index.search(self.queries, k, exclude, nprobe=6)
+            self.assertEqual(rows.tolist(), exact_rows.tolist())
+            self.assertTrue(np.allclose(scores, exact_scores, atol=1e-5))
+        self.assertSearch(index, 10, nprobe=100)
+
+    def test_approximate_needs_lists(self):
+        with tempfile.TemporaryDirectory() as d:
+            build_neighbor_index(MatrixVocab(self.vectors), d, words=50)
+            index = NeighborIndex(d)
+            self.assertEqual(len(index), 50)
+            with self.assertRaises(ValueError):
+                index.search(self.queries, 5, nprobe=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import contextlib
+import gc
+import io
+import os
+import signal
+import unittest
+from unittest import mock
+from serving import prefork
+
+
+class PreforkTestcase(unittest.TestCase):
+    def setUp(self):
+        handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGINT, signal.SIGTERM)}
+        self.addCleanup(lambda: [signal.signal(signum, handler) for signum, handler in handlers.items()])
+        self.addCleanup(gc.unfreeze)
+
+    def test_gives_up_on_workers_crashing_at_startup(self):
+        output = io.StringIO()
+        with mock.patch.object(prefork, '_run_worker', lambda app, sock, threads: os._exit(3)), \
+                mock.patch.multiple(prefork, RESTART_DELAY=0.01, MAX_CRASHES=4), \
+                contextlib.redirect_stdout(output), self.assertRaises(SystemExit) as raised:
+            prefork.run_prefork(None, 0, 2)
+        self.assertIn('giving up', str(raised.exception.code))
+        # three restarts with a doubling delay, then the fourth crash stops the master
+        self.assertEqual([line.split(' in ')[-1] for line in output.getvalue().splitlines()
+                          if 'restarting' in line], ['0.01s', '0.02s', '0.04s'])
+        with self.assertRaises(ChildProcessError):
+            os.wait()
+
+
+if __name__ == '__main__':
+    unittest.main()
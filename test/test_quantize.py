@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from word_vectors import Int8Matrix, PQMatrix, load_matrix
+from word_vectors.quantize import quantize_int8, quantize_pq
+
+
+def cosines(a, b):
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+class QuantizeTestcase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        # a few directions plus noise, like word vectors, and a row of zeros
+        directions = rng.standard_normal((20, 32))
+        cls.matrix = (directions[rng.integers(0, 20, 3000)] + 0.3 * rng.standard_normal((3000, 32))).astype(np.float32)
+        cls.matrix[7] = 0
+        np.save(os.path.join(cls.dir.name, 'vectors.npy'), cls.matrix)
+        quantize_int8(cls.matrix, cls.dir.name, 'int8', block_size=1000)
+        quantize_pq(cls.matrix, cls.dir.name, 'pq', subspaces=8, sample_size=2000, block_size=1000)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def assertRows(self, quantized):
+        self.assertEqual(quantized.shape, self.matrix.shape)
+        self.assertEqual(len(quantized), len(self.matrix))
+        rows = np.array([3, 0, 2999, 3])
+        self.assertTrue(np.array_equal(quantized[rows], quantized[:][rows]))
+        self.assertTrue(np.array_equal(quantized[5], quantized[5:6][0]))
+        self.assertEqual(quantized[5].dtype, np.float32)
+
+    def test_int8_round_trip(self):
+        quantized = load_matrix(self.dir.name, 'int8')
+        self.assertIsInstance(quantized, Int8Matrix)
+        self.assertRows(quantized)
+        restored = quantized[:]
+        # every value within half a step of its row's scale
+        errors = np.abs(restored - self.matrix)
+        self.assertTrue(np.all(errors <= quantized.scales[:, None] / 2 + 1e-6))
+        self.assertTrue(np.array_equal(restored[7], np.zeros(32)))
+        nonzero = np.arange(len(self.matrix)) != 7
+        self.assertGreater(cosines(restored[nonzero], self.matrix[nonzero]).min(), 0.999)
+        self.assertLess(quantized.nbytes, self.matrix.nbytes / 3)
+
+    def test_pq_round_trip(self):
+        quantized = load_matrix(self.dir.name, 'pq')
+        self.assertIsInstance(quantized, PQMatrix)
+        self.assertRows(quantized)
+        similarities = cosines(quantized[:][8:], self.matrix[8:])
+        self.assertGreater(similarities.mean(), 0.98)
+        self.assertGreater(similarities.min(), 0.9)
+        self.assertEqual(quantized.codes.nbytes, len(self.matrix) * 8)
+
+    def test_pq_needs_dividing_subspaces(self):
+        with self.assertRaises(ValueError):
+            quantize_pq(self.matrix, self.dir.name, 'bad', subspaces=5)
+
+    def test_full_matrix(self):
+        matrix = load_matrix(self.dir.name, 'vectors')
+        self.assertIsInstance(matrix, np.memmap)
+        self.assertTrue(np.array_equal(matrix, self.matrix))
+
+
+if __name__ == '__main__':
+    unittest.main()
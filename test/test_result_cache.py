@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+from serving.cache import ResultCache
+
+
+class CountingPredictor:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, inputs):
+        self.calls.append([d['sentence'] for d in inputs])
+        return [{'echo': d['sentence']} for d in inputs]
+
+
+def sentences(*names):
+    return [{'sentence': name} for name in names]
+
+
+class ResultCacheTestcase(unittest.IsolatedAsyncioTestCase):
+    async def test_duplicates_predicted_once(self):
+        cache = ResultCache('model')
+        model = CountingPredictor()
+        predict = cache.wrap(model)
+        results = await predict(sentences('a', 'b', 'a', 'a'))
+        self.assertEqual(results, [{'echo': name} for name in 'abaa'])
+        self.assertEqual(model.calls, [['a', 'b']])
+        self.assertEqual((cache.misses, cache.deduplicated, cache.hits), (2, 2, 0))
+
+    async def test_repeat_is_a_hit(self):
+        cache = ResultCache('model')
+        model = CountingPredictor()
+        predict = cache.wrap(model)
+        await predict(sentences('a', 'b'))
+        self.assertEqual(await predict(sentences('b', 'c')), [{'echo': 'b'}, {'echo': 'c'}])
+        self.assertEqual(model.calls, [['a', 'b'], ['c']])
+        self.assertEqual(await predict(sentences('a', 'c')), [{'echo': 'a'}, {'echo': 'c'}])
+        self.assertEqual(len(model.calls), 2)
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(cache.stats()['hit_rate'], 3 / 6)
+
+    async def test_options_are_part_of_the_key(self):
+        cache = ResultCache('model')
+        model = CountingPredictor()
+        predict = cache.wrap(model)
+        await predict([{'sentence': 'a'}, {'sentence': 'a', 'k': 1}, {'sentence': 'a '}])
+        self.assertEqual(model.calls, [['a', 'a', 'a ']])
+
+    async def test_evicts_least_recently_used(self):
+        cache = ResultCache('model', max_size=2)
+        model = CountingPredictor()
+        predict = cache.wrap(model)
+        await predict(sentences('a', 'b'))
+        await predict(sentences('a'))  # b is now the least recently used
+        await predict(sentences('c'))
+        self.assertEqual(cache.evictions, 1)
+        await predict(sentences('a', 'c'))
+        self.assertEqual(model.calls, [['a', 'b'], ['c']])
+        await predict(sentences('b'))
+        self.assertEqual(model.calls, [['a', 'b'], ['c'], ['b']])
+        self.assertEqual(cache.stats()['size'], 2)
+
+    async def test_ttl_expiry(self):
+        cache = ResultCache('model', ttl=10)
+        model = CountingPredictor()
+        predict = cache.wrap(model)
+        with mock.patch('serving.cache.time.monotonic', return_value=100.0):
+            await predict(sentences('a'))
+        with mock.patch('serving.cache.time.monotonic', return_value=105.0):
+            await predict(sentences('a'))
+        self.assertEqual(model.calls, [['a']])
+        with mock.patch('serving.cache.time.monotonic', return_value=111.0):
+            await predict(sentences('a'))
+        self.assertEqual(model.calls, [['a'], ['a']])
+        self.assertEqual(cache.evictions, 1)
+
+    async def test_disabled(self):
+        cache = ResultCache('model', max_size=0)
+        model = CountingPredictor()
+        predict = cache.wrap(model)
+        await predict(sentences('a', 'a'))
+        await predict(sentences('a'))
+        self.assertEqual(model.calls, [['a', 'a'], ['a']])
+
+
+if __name__ == '__main__':
+    unittest.main()
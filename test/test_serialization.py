@@ -0,0 +1,48 @@
+import argparse
+import json
+import math
+import unittest
+import numpy as np
+from aiohttp import web
+from serving import serialization
+from serving.serialization import dumps, json_response, setup_serialization
+
+
+class Token:
+    def __init__(self, text):
+        self.text = text
+
+
+class SerializationTestcase(unittest.TestCase):
+    def test_same_bytes_as_json(self):
+        # What the servers returned with allennlp's `sanitize` and `json.dumps`.
+        vector = np.array([0.1, 1 / 3, 1e-8, math.nan, math.inf], dtype=np.float32)
+        data = {'vector': vector, 'score': np.float32(0.1), 'count': np.int64(3), 'words': ['naïve', 'café', '日本'],
+                'tokens': [Token('über')], 'nan': math.nan}
+        expected = json.dumps({'vector': vector.tolist(), 'score': np.float32(0.1).item(), 'count': 3,
+                               'words': ['naïve', 'café', '日本'], 'tokens': ['über'], 'nan': math.nan}).encode()
+        self.assertEqual(dumps(data), expected)
+
+    def test_same_response_as_json_response(self):
+        data = {'words': ['café'], 'score': 0.5}
+        response, expected = json_response(data, status=400), web.json_response(data, status=400)
+        self.assertEqual(response.headers['Content-Type'], 'application/json; charset=utf-8')
+        self.assertEqual(response.headers['Content-Type'], expected.headers['Content-Type'])
+        self.assertEqual((response.status, response.body), (expected.status, expected.body))
+
+    def test_orjson_is_opt_in(self):
+        parser = argparse.ArgumentParser()
+        serialization.add_serialization_arguments(parser)
+        args = parser.parse_args([])
+        setup_serialization(None, args)
+        self.assertFalse(serialization._use_orjson)
+        if serialization.orjson is None:
+            with self.assertRaises(ValueError):
+                setup_serialization(None, parser.parse_args(['--orjson']))
+            return
+        try:
+            setup_serialization(None, parser.parse_args(['--orjson']))
+            self.assertEqual(json.loads(dumps({'words': ['café'], 'count': np.int64(3)})),
+                             {'words': ['café'], 'count': 3})
+        finally:
+            setup_serialization(None, args)
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from serving.store import PredictionStore, prune_store
+
+
+class CountingPredictor:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, inputs):
+        self.calls.append([d['sentence'] for d in inputs])
+        return [{'echo': d['sentence']} for d in inputs]
+
+
+def sentences(*names):
+    return [{'sentence': name} for name in names]
+
+
+class StoreTestcase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'predictions.sqlite')
+
+    def rows(self, *columns):
+        db = sqlite3.connect(self.path)
+        try:
+            return sorted(db.execute(f'SELECT {", ".join(columns)} FROM predictions'))
+        finally:
+            db.close()
+
+    async def open(self, service='srl', checkpoint='c1', **kwargs):
+        store = PredictionStore(self.path, service, checkpoint, **kwargs)
+        await store.start()
+        self.addAsyncCleanup(store.stop)
+        return store
+
+    async def test_hit_and_miss(self):
+        store = await self.open()
+        model = CountingPredictor()
+        predict = store.wrap(model)
+        self.assertEqual(await predict(sentences('a', 'b')), [{'echo': 'a'}, {'echo': 'b'}])
+        await store.stop()
+
+        # a restarted server finds them in the file
+        store = await self.open()
+        predict = store.wrap(model)
+        self.assertEqual(await predict(sentences('b', 'c', 'a')), [{'echo': 'b'}, {'echo': 'c'}, {'echo': 'a'}])
+        self.assertEqual(model.calls, [['a', 'b'], ['c']])
+        self.assertEqual((store.hits, store.misses), (2, 1))
+
+    async def test_other_service_or_checkpoint_is_a_miss(self):
+        model = CountingPredictor()
+        store = await self.open()
+        await store.wrap(model)(sentences('a'))
+        await store.stop()
+        for service, checkpoint in ('srl', 'c2'), ('parser', 'c1'):
+            store = await self.open(service, checkpoint)
+            await store.wrap(model)(sentences('a'))
+            self.assertEqual((store.hits, store.misses), (0, 1))
+            await store.stop()
+        self.assertEqual(len(model.calls), 3)
+
+    async def test_flush_at_flush_size(self):
+        store = await self.open(flush_interval=60)
+        predict = store.wrap(CountingPredictor())
+        await predict(sentences(*map(str, range(255))))
+        await asyncio.sleep(0.05)
+        self.assertEqual((store.writes, len(self.rows('key'))), (0, 0))
+        await predict(sentences('255'))
+        for _ in range(100):
+            if store.writes:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual((store.writes, len(self.rows('key'))), (256, 256))
+
+    async def test_flush_at_flush_interval(self):
+        store = await self.open()
+        predict = store.wrap(CountingPredictor())
+        await predict(sentences('a'))
+        self.assertEqual(store.stats()['pending_writes'], 1)
+        await asyncio.sleep(store.flush_interval + 0.2)
+        self.assertEqual(self.rows('service', 'checkpoint', 'value'), [('srl', 'c1', '{"echo": "a"}')])
+        self.assertEqual(store.stats()['pending_writes'], 0)
+
+    async def test_prune(self):
+        model = CountingPredictor()
+        # service names that would match each other as LIKE patterns
+        for service, checkpoint in [('nom_srl', 'old'), ('nom_srl', 'new'), ('nomXsrl', 'old'),
+                                    ('nom%', 'old'), ('nom_srl_v2', 'old')]:
+            store = await self.open(service, checkpoint)
+            await store.wrap(model)(sentences('a'))
+            await store.stop()
+
+        prune_store(self.path, 'nom_srl', 'new')
+        self.assertEqual(self.rows('service', 'checkpoint'),
+                         [('nom%', 'old'), ('nomXsrl', 'old'), ('nom_srl', 'new'), ('nom_srl_v2', 'old')])
+        prune_store(self.path, 'nom%', 'new')
+        self.assertEqual(self.rows('service', 'checkpoint'),
+                         [('nomXsrl', 'old'), ('nom_srl', 'new'), ('nom_srl_v2', 'old')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import unittest
+from unittest import mock
+from serving import streaming
+from serving.streaming import stream_ndjson
+
+
+class FakeStreamResponse:
+    """
+    Records what is written, or raises ``ConnectionResetError`` from ``write`` like a
+    response whose client went away once ``disconnect_after`` writes went through.
+    """
+
+    instances = []
+
+    def __init__(self, headers=None, disconnect_after=None):
+        self.headers = headers
+        self.disconnect_after = disconnect_after
+        self.writes = []
+        self.eof = False
+        FakeStreamResponse.instances.append(self)
+
+    def enable_chunked_encoding(self):
+        pass
+
+    async def prepare(self, request):
+        pass
+
+    async def write(self, data):
+        if self.disconnect_after is not None and len(self.writes) >= self.disconnect_after:
+            raise ConnectionResetError('Cannot write to closing transport')
+        self.writes.append(data)
+
+    async def write_eof(self):
+        self.eof = True
+
+    def lines(self):
+        return [json.loads(line) for line in b''.join(self.writes).splitlines()]
+
+
+class StreamingTestcase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        FakeStreamResponse.instances = []
+        self.unhandled = []
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: self.unhandled.append(context))
+        self.addCleanup(loop.set_exception_handler, None)
+
+    def respond(self, disconnect_after=None):
+        return mock.patch.object(streaming.web, 'StreamResponse',
+                                 lambda headers: FakeStreamResponse(headers, disconnect_after))
+
+    async def test_lines_in_input_order(self):
+        async def predict_chunk(chunk):
+            return [{'echo': d['sentence']} for d in chunk]
+
+        inputs = [{'sentence': str(i)} for i in range(5)]
+        with self.respond():
+            response = await stream_ndjson(None, inputs, predict_chunk, chunk_size=2)
+        self.assertEqual(response.lines(), [{'echo': str(i)} for i in range(5)])
+        self.assertTrue(response.eof)
+
+    async def test_failing_chunk_ends_with_error_line(self):
+        async def predict_chunk(chunk):
+            if chunk[0]['sentence'] == '2':
+                raise ValueError('bad chunk')
+            return [{'echo': d['sentence']} for d in chunk]
+
+        inputs = [{'sentence': str(i)} for i in range(6)]
+        with self.respond(), contextlib.redirect_stdout(io.StringIO()):
+            response = await stream_ndjson(None, inputs, predict_chunk, chunk_size=2)
+        self.assertEqual(response.lines(), [{'echo': '0'}, {'echo': '1'}, {'error': 'Invalid request'}])
+        self.assertTrue(response.eof)
+
+    async def test_disconnect_cancels_next_chunk(self):
+        cancelled = asyncio.Event()
+
+        async def predict_chunk(chunk):
+            if chunk[0]['sentence'] == '0':
+                return [{'echo': '0'}]
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        inputs = [{'sentence': str(i)} for i in range(3)]
+        with self.respond(disconnect_after=0), self.assertRaises(ConnectionResetError):
+            await stream_ndjson(None, inputs, predict_chunk, chunk_size=1)
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    async def test_disconnect_retrieves_failed_next_chunk(self):
+        first_done = asyncio.Event()
+
+        async def predict_chunk(chunk):
+            if chunk[0]['sentence'] == '0':
+                await first_done.wait()
+                return [{'echo': '0'}]
+            raise ValueError('bad chunk')
+
+        async def finish_first():
+            # Let the prefetched chunk fail before the first one is written out.
+            await asyncio.sleep(0.01)
+            first_done.set()
+
+        inputs = [{'sentence': str(i)} for i in range(2)]
+        asyncio.ensure_future(finish_first())
+        with self.respond(disconnect_after=0), self.assertRaises(ConnectionResetError):
+            await stream_ndjson(None, inputs, predict_chunk, chunk_size=1)
+        await asyncio.sleep(0)
+        gc.collect()
+        await asyncio.sleep(0)
+        self.assertEqual([context['message'] for context in self.unhandled], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
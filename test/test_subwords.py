@@ -0,0 +1,43 @@
+import os
+import random
+import tempfile
+import unittest
+import fasttext
+import numpy as np
+from word_vectors import Vocabulary, export_vocab
+
+OOV_WORDS = ['unseenword', 'xyzzy', 'a', 'naïveté', 'über', 'ñandú', 'straße', 'Ωmega', '日本語', 'кошка', 'emoji🙂',
+             'é', '']
+
+
+class SubwordTestcase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.TemporaryDirectory()
+        rng = random.Random(0)
+        letters = 'abcdefghijklmnopqrstuvwxyzéüñßж日本'
+        words = [''.join(rng.choice(letters) for _ in range(rng.randint(2, 8))) for _ in range(200)]
+        corpus = os.path.join(cls.dir.name, 'corpus.txt')
+        with open(corpus, 'w', encoding='utf-8') as f:
+            for _ in range(300):
+                f.write(' '.join(rng.choice(words) for _ in range(12)) + '\n')
+        cls.model = fasttext.train_unsupervised(corpus, dim=16, epoch=1, minCount=1, minn=2, maxn=5, bucket=5000,
+                                                thread=1, verbose=0)
+        cls.vocab_path = os.path.join(cls.dir.name, 'vocab')
+        export_vocab(cls.model, cls.vocab_path)
+        cls.vocab = Vocabulary(cls.vocab_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.dir.cleanup()
+
+    def test_oov_vectors_match_fasttext(self):
+        words = [w for w in OOV_WORDS if self.model.get_word_id(w) < 0]
+        self.assertEqual(len(words), len(OOV_WORDS))
+        expected = np.stack([self.model.get_word_vector(w) for w in words])
+        self.assertTrue(np.array_equal(self.vocab.subwords.vectors(words), expected))
+
+    def test_in_vocabulary_vectors_match_fasttext(self):
+        words = self.model.words[:50]
+        expected = np.stack([self.model.get_word_vector(w) for w in words])
+        self.assertTrue(np.array_equal(self.vocab.vectors[self.vocab.rows(words)], expected))
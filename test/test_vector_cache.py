@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from word_vectors import VectorCache, read_frequencies, read_frequency_list
+
+try:
+    from serve_fasttext import WordToVectorDict
+except ImportError:
+    WordToVectorDict = None
+
+DIM = 4
+
+
+class CountingModel:
+    """A fasttext model whose word vectors are random, counting the words it is asked for."""
+
+    def __init__(self, words):
+        rng = np.random.default_rng(0)
+        self.vectors = {word: rng.standard_normal(DIM).astype(np.float32) for word in words}
+        self.calls = []
+
+    def get_dimension(self):
+        return DIM
+
+    def get_word_vector(self, word):
+        self.calls.append(word)
+        return self.vectors[word]
+
+
+class VectorCacheTestcase(unittest.TestCase):
+    def setUp(self):
+        self.model = CountingModel('abcdefgh')
+
+    def lookup(self, cache, words):
+        # what WordToVectorDict.fill_word_vectors does
+        slots = cache.get(words)
+        out = np.empty((len(words), DIM), dtype=np.float32)
+        found = np.flatnonzero(slots >= 0)
+        out[found] = cache.arena[slots[found]]
+        missing = np.flatnonzero(slots < 0)
+        if len(missing):
+            missing_words = [words[i] for i in missing]
+            vectors = np.stack([self.model.get_word_vector(w) for w in missing_words])
+            out[missing] = vectors
+            cache.put(missing_words, vectors)
+        return out
+
+    def assertVectors(self, words, vectors):
+        self.assertTrue(np.array_equal(vectors, np.stack([self.model.vectors[w] for w in words])))
+
+    def test_cached_words_not_recomputed(self):
+        cache = VectorCache(4, DIM)
+        self.assertVectors('abc', self.lookup(cache, list('abc')))
+        self.assertVectors('cab', self.lookup(cache, list('cab')))
+        self.assertEqual(self.model.calls, list('abc'))
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+    def test_evicted_slots_reused(self):
+        cache = VectorCache(3, DIM)
+        self.lookup(cache, list('abc'))
+        slots = dict(zip('abc', cache.get(list('abc'))))
+        self.assertEqual(sorted(slots.values()), [0, 1, 2])
+        self.lookup(cache, list('b'))  # a, then c are now the least recently used
+        self.assertVectors('de', self.lookup(cache, list('de')))
+        self.assertEqual(cache.evictions, 2)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(sorted(cache.get(list('de'))), sorted([slots['a'], slots['c']]))
+        self.assertEqual(cache.get(list('ac')).tolist(), [-1, -1])
+        self.assertVectors('bde', cache.arena[cache.get(list('bde'))])
+
+        self.model.calls = []
+        self.assertVectors('abcde', self.lookup(cache, list('abcde')))
+        self.assertEqual(self.model.calls, list('ac'))
+
+    def test_put_more_than_capacity(self):
+        cache = VectorCache(2, DIM)
+        words = list('abcd')
+        cache.put(words, np.stack([self.model.vectors[w] for w in words]))
+        self.assertEqual(cache.get(words).tolist()[:2], [-1, -1])
+        self.assertVectors('cd', cache.arena[cache.get(list('cd'))])
+
+    def test_read_frequencies(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'frequencies.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('the 100\nnew york 7\ncafé 30\nbare\n\nof 50\n')
+            self.assertEqual(read_frequencies(path), [('the', 100), ('of', 50), ('café', 30), ('new york', 7),
+                                                      ('bare', 0)])
+            self.assertEqual(read_frequency_list(path, 2), ['the', 'of'])
+
+    @unittest.skipIf(WordToVectorDict is None, 'needs fasttext')
+    def test_word_vector_dict_uses_cache(self):
+        vectors = WordToVectorDict(model=self.model, cache_size=3)
+        vectors.warm_cache(['a', 'b', 'a'])
+        self.assertEqual(self.model.calls, ['a', 'b'])
+        self.assertEqual((vectors.cache.hits, vectors.cache.misses), (0, 0))
+        self.assertVectors('abc', vectors.matrix(['a', 'b', 'c']))
+        self.assertVectors('cab', vectors.matrix(['c', 'a', 'b']))
+        self.assertEqual(self.model.calls, ['a', 'b', 'c'])
+        # the warm-up computes past the cache
+        vectors.embed(['a d'], cached=False)
+        self.assertEqual(self.model.calls, ['a', 'b', 'c', 'a', 'd'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,6 +30,13 @@ class VerbSRLTestcase(unittest.TestCase):
             self.assertIsInstance(srl_pred, VerbSRLResult)
             self.assertDictEqual(asdict(srl_pred), srl_gold)
 
+    def test_batch_predict_stream(self):
+        predictions = list(self.predictor.batch_predict_stream(self.sentences + ['']))
+        self.assertEqual(len(predictions), len(self.sentences) + 1)
+        for srl_pred, srl_gold in zip(predictions, self.references):
+            self.assertIsInstance(srl_pred, VerbSRLResult)
+            self.assertDictEqual(asdict(srl_pred), srl_gold)
+
 
 if __name__ == '__main__':
     unittest.main()
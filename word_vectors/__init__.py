@@ -0,0 +1,8 @@
+from word_vectors.cache import VectorCache, read_frequencies, read_frequency_list
+from word_vectors.hashing import fnv1a, pack
+from word_vectors.neighbors import NeighborIndex, build_neighbor_index
+from word_vectors.pooling import SIFWeights, tokenize
+from word_vectors.quantize import Int8Matrix, PQMatrix, load_matrix
+from word_vectors.segments import segment_sum
+from word_vectors.subwords import SubwordModel
+from word_vectors.vocab import Vocabulary, export_vocab, quantize_vocab
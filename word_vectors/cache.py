@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import List, Tuple
+import numpy as np
+
+
+class VectorCache:
+    """
+    An LRU cache of word vectors, stored as the rows of one preallocated float32 ``arena`` of
+    ``capacity`` rows rather than as separate arrays: its memory is fixed at
+    ``capacity * dim * 4`` bytes, and cached vectors are copied out with one gather.
+    """
+
+    def __init__(self, capacity: int, dim: int):
+        self.capacity = capacity
+        self.arena = np.empty((capacity, dim), dtype=np.float32)
+        self._slots = OrderedDict()  # word -> row of `arena`, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get(self, words: List[str]) -> np.ndarray:
+        """Returns the rows of ``words`` in ``arena``, -1 for the words not cached."""
+        slots = np.empty(len(words), dtype=np.int64)
+        for i, word in enumerate(words):
+            slot = self._slots.get(word)
+            if slot is None:
+                slots[i] = -1
+            else:
+                self._slots.move_to_end(word)
+                slots[i] = slot
+        found = int(np.count_nonzero(slots >= 0))
+        self.hits += found
+        self.misses += len(words) - found
+        return slots
+
+    def put(self, words: List[str], vectors: np.ndarray):
+        """Caches the vectors of the distinct ``words``, evicting the least recently used ones."""
+        if len(words) > self.capacity:
+            words, vectors = words[len(words) - self.capacity:], vectors[len(words) - self.capacity:]
+        slots = np.empty(len(words), dtype=np.int64)
+        for i, word in enumerate(words):
+            slot = self._slots.get(word)
+            if slot is not None:
+                self._slots.move_to_end(word)
+            elif len(self._slots) < self.capacity:
+                slot = self._slots[word] = len(self._slots)
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self._slots[word] = slot
+                self.evictions += 1
+            slots[i] = slot
+        self.arena[slots] = vectors
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._slots),
+            'capacity': self.capacity,
+            'bytes': self.arena.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'evictions': self.evictions,
+        }
+
+
+def read_frequencies(path: str) -> List[Tuple[str, int]]:
+    """
+    Reads a frequency list with one ``word`` or ``word count`` per line, sorted by decreasing count.
+    Words without a count count as 0, and keep the order of the file.
+    """
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').rsplit(' ', 1)
+            if len(fields) == 2 and fields[1].isdigit():
+                entries.append((fields[0], int(fields[1])))
+            elif fields[0]:
+                entries.append((' '.join(fields), 0))
+    entries.sort(key=lambda entry: -entry[1])
+    return entries
+
+
+def read_frequency_list(path: str, limit: int) -> List[str]:
+    """Reads the ``limit`` most frequent words of a frequency list, see ``read_frequencies``."""
+    return [word for word, _ in read_frequencies(path)[:limit]]
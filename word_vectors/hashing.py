@@ -0,0 +1,37 @@
+from typing import List, Tuple
+import numpy as np
+
+FNV_OFFSET_BASIS = 2166136261
+FNV_PRIME = 16777619
+
+
+def pack(strings: List[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Concatenates ``strings`` into one uint8 buffer, returning it with the start and the length of
+    every string in it.
+    """
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    starts = np.cumsum(lengths) - lengths
+    return np.frombuffer(b''.join(strings), dtype=np.uint8), starts, lengths
+
+
+def fnv1a(buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    32-bit FNV-1a hashes of the byte strings ``buffer[starts[i]:starts[i] + lengths[i]]``, all
+    computed together. Like fasttext's ``Dictionary::hash``, bytes are sign-extended before
+    being xored in, so the hashes of non-ASCII strings match fasttext's.
+    """
+    data = buffer.view(np.int8).astype(np.uint32)
+    # longest strings first, so the strings still being hashed at byte j are a prefix
+    order = np.argsort(-lengths, kind='stable')
+    starts, lengths = starts[order], lengths[order]
+    hashes = np.full(len(order), FNV_OFFSET_BASIS, dtype=np.uint32)
+    prime = np.uint32(FNV_PRIME)
+    for j in range(int(lengths[0]) if len(lengths) else 0):
+        n = np.searchsorted(-lengths, -j, side='left')
+        np.bitwise_xor(hashes[:n], data[starts[:n] + j], out=hashes[:n])
+        np.multiply(hashes[:n], prime, out=hashes[:n])
+
+    out = np.empty_like(hashes)
+    out[order] = hashes
+    return out
@@ -0,0 +1,145 @@
+import json
+import os
+from typing import Optional, Tuple
+import numpy as np
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The ``k`` best ``scores`` of every row and their ``rows``, best first."""
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, rows = np.take_along_axis(scores, best, 1), np.take_along_axis(rows, best, 1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, 1), np.take_along_axis(rows, order, 1)
+
+
+class NeighborIndex:
+    """
+    A cosine-similarity index over the first words of a ``Vocabulary``, i.e. its most frequent
+    ones, as written by ``build_neighbor_index``. Row ``i`` of the index is row ``i`` of the
+    vocabulary. The normalized vectors are memory-mapped like the vocabulary.
+
+    Exact search multiplies the queries with blocks of ``block_size`` vectors at a time, keeping
+    the best ``k`` of every query as it goes. If the index was built with inverted lists,
+    approximate search only scores the vectors of the ``nprobe`` lists closest to each query.
+    """
+
+    def __init__(self, path: str, block_size: int = 65536):
+        self.path = path
+        self.block_size = block_size
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.vectors = self._load('vectors.npy')
+        self.centroids = self.list_rows = self.list_offsets = None
+        if self.meta['lists']:
+            self.centroids = self._load('centroids.npy')
+            self.list_rows = self._load('list_rows.npy')
+            self.list_offsets = self._load('list_offsets.npy')
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries: np.ndarray, k: int, exclude: Optional[np.ndarray] = None,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the rows of the ``k`` nearest neighbors of each query vector and their cosine
+        similarities, best first. ``exclude`` gives a row to leave out for each query, e.g. the
+        query word itself, or -1. With ``nprobe``, the search is approximate.
+        """
+        queries = normalize(np.asarray(queries, dtype=np.float32))
+        if exclude is None:
+            exclude = np.full(len(queries), -1)
+        k = min(k, len(self) - 1 if (exclude >= 0).any() else len(self))
+        if nprobe is None:
+            return self._search_exact(queries, k, exclude)
+        if self.centroids is None:
+            raise ValueError('the neighbor index has no inverted lists for approximate search')
+        return self._search_lists(queries, k, exclude, nprobe)
+
+    def _search_exact(self, queries, k, exclude):
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        queries_idx = np.arange(len(queries))
+        for start in range(0, len(self), self.block_size):
+            block = self.vectors[start:start + self.block_size]
+            scores = queries @ block.T
+            excluded = (exclude >= start) & (exclude < start + len(block))
+            scores[queries_idx[excluded], exclude[excluded] - start] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_rows = top_k(np.concatenate([best_scores, scores], axis=1),
+                                           np.concatenate([best_rows, rows], axis=1), k)
+        return best_rows, best_scores
+
+    def _search_lists(self, queries, k, exclude, nprobe):
+        nprobe = min(nprobe, len(self.centroids))
+        _, probes = top_k(queries @ self.centroids.T,
+                          np.broadcast_to(np.arange(len(self.centroids)), (len(queries), len(self.centroids))),
+                          nprobe)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]]
+                                         for c in probes[i]])
+            candidates = candidates[candidates != exclude[i]]
+            found_scores, found_rows = top_k((self.vectors[candidates] @ query)[None], candidates[None], k)
+            rows[i, :found_rows.shape[1]] = found_rows[0]
+            scores[i, :found_scores.shape[1]] = found_scores[0]
+        return rows, scores
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10,
+                     rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Returns ``n_clusters`` normalized centroids of the normalized ``vectors``."""
+    rng = rng or np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = np.flatnonzero(np.bincount(assignment, minlength=n_clusters) == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def build_neighbor_index(vocab, path: str, words: Optional[int] = None, lists: int = 0,
+                         sample_size: int = 256, block_size: int = 65536):
+    """
+    Writes a ``NeighborIndex`` of the first ``words`` words of ``vocab`` (all of them by default)
+    to the directory ``path``. With ``lists``, the vectors are also clustered into that many
+    inverted lists for approximate search, by k-means on ``sample_size`` vectors per list.
+    """
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        os.remove(os.path.join(path, 'meta.json'))
+    n = min(words or len(vocab), len(vocab))
+    vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+', dtype=np.float32,
+                                        shape=(n, vocab.dim))
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        vectors[start:end] = normalize(vocab.vectors[start:end])
+
+    if lists:
+        rng = np.random.default_rng(0)
+        sample = vectors[np.sort(rng.choice(n, min(n, lists * sample_size), replace=False))]
+        centroids = spherical_kmeans(sample, lists, rng=rng)
+        assignment = np.concatenate([np.argmax(vectors[start:start + block_size] @ centroids.T, axis=1)
+                                     for start in range(0, n, block_size)])
+        list_rows = np.argsort(assignment, kind='stable')
+        np.save(os.path.join(path, 'centroids.npy'), centroids)
+        np.save(os.path.join(path, 'list_rows.npy'), list_rows)
+        np.save(os.path.join(path, 'list_offsets.npy'),
+                np.searchsorted(assignment[list_rows], np.arange(lists + 1)))
+    vectors.flush()
+    del vectors
+    # written last, so that an interrupted build cannot be loaded
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'words': n, 'lists': lists}, f)
@@ -0,0 +1,28 @@
+import re
+from typing import Dict, List
+import numpy as np
+
+# words, keeping emails, urls, hyphenated words and contractions whole; punctuation is dropped
+TOKEN_PATTERN = re.compile(r"\w+(?:[-'.@/:]+\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text)
+
+
+class SIFWeights:
+    """
+    Smooth inverse frequency weights ``a / (a + p(w))`` of words, from "A Simple but Tough-to-Beat
+    Baseline for Sentence Embeddings" (Arora et al., 2017), where ``p(w)`` is the relative frequency
+    of ``w`` in ``frequencies``. Words missing from ``frequencies`` get a weight of 1.
+    The removal of the common component of the paper needs a corpus and is not done.
+    """
+
+    def __init__(self, frequencies: Dict[str, int], a: float = 1e-3):
+        self.frequencies = frequencies
+        self.total = sum(frequencies.values())
+        self.a = a
+
+    def __call__(self, words: List[str]) -> np.ndarray:
+        counts = np.fromiter((self.frequencies.get(w, 0) for w in words), dtype=np.float64, count=len(words))
+        return (self.a / (self.a + counts / max(self.total, 1))).astype(np.float32)
@@ -0,0 +1,131 @@
+import os
+from typing import Optional
+import numpy as np
+
+
+class Int8Matrix:
+    """
+    A float32 matrix stored as int8 rows with one float32 scale per row, ``row = data * scale``.
+    Indexing it dequantizes the selected rows only.
+    """
+
+    def __init__(self, data: np.ndarray, scales: np.ndarray):
+        self.data = data
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, rows):
+        return self.data[rows].astype(np.float32) * self.scales[rows, None]
+
+
+class PQMatrix:
+    """
+    A float32 matrix stored with product quantization: its columns are split into subspaces of
+    ``codebooks.shape[2]`` columns, and each subspace of each row stored as the uint8 index of the
+    closest of the 256 centroids of its ``codebooks``. Indexing it dequantizes the selected rows only.
+    """
+
+    def __init__(self, codes: np.ndarray, codebooks: np.ndarray):
+        self.codes = codes
+        self.codebooks = codebooks
+        self._subspaces = np.arange(codebooks.shape[0])
+
+    @property
+    def shape(self):
+        return len(self.codes), self.codebooks.shape[0] * self.codebooks.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, rows):
+        codes = np.asarray(self.codes[rows])
+        return self.codebooks[self._subspaces, codes].reshape(codes.shape[:-1] + (self.shape[1],))
+
+
+def load_matrix(path: str, name: str):
+    """
+    Memory-maps the matrix ``name`` of the directory ``path``, as written by ``np.save``,
+    ``quantize_int8`` or ``quantize_pq``.
+    """
+    def load(suffix):
+        return np.load(os.path.join(path, f'{name}{suffix}.npy'), mmap_mode='r')
+
+    if os.path.exists(os.path.join(path, f'{name}.int8.npy')):
+        return Int8Matrix(load('.int8'), load('.scales'))
+    if os.path.exists(os.path.join(path, f'{name}.pq.npy')):
+        return PQMatrix(load('.pq'), load('.codebooks'))
+    return load('')
+
+
+def quantize_int8(matrix, path: str, name: str, block_size: int = 65536):
+    """Writes ``matrix`` to the directory ``path`` as an ``Int8Matrix``, scaling each row by its maximum."""
+    n, dim = matrix.shape
+    data = np.lib.format.open_memmap(os.path.join(path, f'{name}.int8.npy'), mode='w+', dtype=np.int8, shape=(n, dim))
+    scales = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block_size):
+        block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+        block_scales = np.abs(block).max(axis=1) / 127
+        block_scales[block_scales == 0] = 1
+        data[start:start + block_size] = np.rint(block / block_scales[:, None])
+        scales[start:start + block_size] = block_scales
+    data.flush()
+    np.save(os.path.join(path, f'{name}.scales.npy'), scales)
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 20,
+           rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Returns ``n_clusters`` centroids of ``vectors`` by Lloyd's algorithm."""
+    rng = rng or np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=len(vectors) < n_clusters)].copy()
+    for _ in range(iterations):
+        assignment = nearest_centroids(vectors, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin of |v - c|^2 = |v|^2 - 2 v.c + |c|^2, where |v|^2 does not matter
+    return np.argmin((centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T, axis=1)
+
+
+def quantize_pq(matrix, path: str, name: str, subspaces: int, sample_size: int = 65536,
+                block_size: int = 65536):
+    """
+    Writes ``matrix`` to the directory ``path`` as a ``PQMatrix`` of ``subspaces`` subspaces, whose
+    codebooks are trained on a sample of ``sample_size`` rows.
+    """
+    n, dim = matrix.shape
+    if dim % subspaces:
+        raise ValueError(f'the dimension {dim} is not a multiple of {subspaces} subspaces')
+    width = dim // subspaces
+    rng = np.random.default_rng(0)
+    sample = np.asarray(matrix[np.sort(rng.choice(n, min(n, sample_size), replace=False))], dtype=np.float32)
+    codebooks = np.stack([kmeans(sample[:, i * width:(i + 1) * width], 256, rng=rng) for i in range(subspaces)])
+
+    codes = np.lib.format.open_memmap(os.path.join(path, f'{name}.pq.npy'), mode='w+', dtype=np.uint8,
+                                      shape=(n, subspaces))
+    for start in range(0, n, block_size):
+        block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+        codes[start:start + block_size] = np.stack(
+            [nearest_centroids(block[:, i * width:(i + 1) * width], codebooks[i]) for i in range(subspaces)], axis=1)
+    codes.flush()
+    np.save(os.path.join(path, f'{name}.codebooks.npy'), codebooks.astype(np.float32))
@@ -0,0 +1,21 @@
+import numpy as np
+
+
+def segment_sum(matrix: np.ndarray, ids: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Sums of the rows ``matrix[ids]`` over consecutive runs of ``counts[i]`` ids, as a float32
+    ``(len(counts), dim)`` matrix. Rows are gathered straight from ``matrix`` and added in order,
+    one position of all the runs at a time, so every sum is the same as a sequential loop's.
+    """
+    starts = np.cumsum(counts) - counts
+    # longest runs first, so the runs still being summed at position j are a prefix
+    order = np.argsort(-counts, kind='stable')
+    starts, counts = starts[order], counts[order]
+    sums = np.zeros((len(order), matrix.shape[1]), dtype=np.float32)
+    for j in range(int(counts[0]) if len(counts) else 0):
+        n = np.searchsorted(-counts, -j, side='left')
+        sums[:n] += matrix[ids[starts[:n] + j]]
+
+    out = np.empty_like(sums)
+    out[order] = sums
+    return out
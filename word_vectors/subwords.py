@@ -0,0 +1,69 @@
+from typing import List, Tuple
+import numpy as np
+from word_vectors.hashing import fnv1a, pack
+from word_vectors.segments import segment_sum
+
+EOS = '</s>'
+
+
+class SubwordModel:
+    """
+    Vectors of out-of-vocabulary words computed from the input matrix of a fasttext model, the
+    same as ``get_word_vector`` but for a whole batch of words at once: the character n-grams of
+    all the words are hashed together, and their rows gathered and averaged in one pass.
+    Quantized (``.ftz``) models, which remap n-gram buckets, are not supported.
+    """
+
+    def __init__(self, input_matrix: np.ndarray, nwords: int, minn: int, maxn: int, bucket: int):
+        self.input_matrix = input_matrix
+        self.nwords = nwords
+        self.minn = minn
+        self.maxn = maxn
+        self.bucket = bucket
+
+    def ngram_ids(self, words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the rows of the input matrix of the n-grams of every word, concatenated in the
+        order of fasttext's ``computeSubwords``, with the number of n-grams of each word.
+        """
+        if self.maxn <= 0 or self.bucket <= 0:
+            return np.empty(0, dtype=np.int64), np.zeros(len(words), dtype=np.int64)
+
+        buffer, starts, lengths = pack([b'<' + w.encode('utf-8') + b'>' for w in words])
+        # characters start on any byte that is not a utf-8 continuation byte, and end where the
+        # next one starts, or at the end of the buffer
+        bounds = np.append(np.flatnonzero((buffer & 0xC0) != 0x80), len(buffer))
+        first_char = np.searchsorted(bounds, starts)
+        n_chars = np.diff(np.append(first_char, len(bounds) - 1))
+        char_word = np.repeat(np.arange(len(words)), n_chars)
+        char_pos = np.arange(len(char_word)) - first_char[char_word]
+        char_len = n_chars[char_word]
+        has_ngrams = np.array([w != EOS for w in words], dtype=bool)[char_word]
+
+        chars, ns = [], []
+        for n in range(max(self.minn, 1), self.maxn + 1):
+            valid = has_ngrams & (char_pos + n <= char_len)
+            if n == 1:
+                # the lone '<' and '>' are not n-grams
+                valid &= (char_pos != 0) & (char_pos + 1 != char_len)
+            chars.append(np.flatnonzero(valid))
+            ns.append(np.full(len(chars[-1]), n))
+        chars, ns = np.concatenate(chars), np.concatenate(ns)
+        # by word, then start character, then length
+        order = np.argsort(chars * (self.maxn + 1) + ns)
+        chars, ns = chars[order], ns[order]
+
+        ngram_starts = bounds[chars]
+        hashes = fnv1a(buffer, ngram_starts, bounds[chars + ns] - ngram_starts)
+        ids = self.nwords + (hashes % np.uint32(self.bucket)).astype(np.int64)
+        return ids, np.bincount(char_word[chars], minlength=len(words))
+
+    def vectors(self, words: List[str]) -> np.ndarray:
+        """Returns the ``(len(words), dim)`` float32 vectors of the out-of-vocabulary ``words``."""
+        ids, counts = self.ngram_ids(words)
+        vectors = segment_sum(self.input_matrix, ids, counts)
+        # fasttext multiplies the sum by the float32 inverse of the count
+        scale = np.zeros(len(words), dtype=np.float32)
+        np.divide(1.0, counts, out=scale, where=counts > 0, casting='unsafe')
+        vectors *= scale[:, None]
+        return vectors
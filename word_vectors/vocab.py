@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+from typing import List, Optional
+import numpy as np
+from word_vectors.hashing import fnv1a, pack
+from word_vectors.quantize import load_matrix, quantize_int8, quantize_pq
+from word_vectors.subwords import SubwordModel
+
+
+class Vocabulary:
+    """
+    The vectors of the in-vocabulary words of a fasttext model, as written by ``export_vocab``.
+
+    Every file is memory-mapped read-only, so loading takes no time and all the processes of a
+    host share one page-cached copy. Words are found through an open-addressing hash table,
+    itself memory-mapped, instead of a dict built at startup. If the input matrix of the model
+    was exported too, ``subwords`` computes the vectors of out-of-vocabulary words. Both matrices
+    may be quantized by ``quantize_vocab``, and are then dequantized as they are read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.vectors = load_matrix(path, 'vectors')
+        self._words = self._load('words.npy')
+        self._offsets = self._load('offsets.npy')
+        self._table = self._load('table.npy')
+        self._mask = len(self._table) - 1
+        self.subwords = None
+        if 'subwords' in self.meta:
+            self.subwords = SubwordModel(load_matrix(path, 'input'), **self.meta['subwords'])
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def quantization(self) -> Optional[str]:
+        """The method ``quantize_vocab`` quantized the matrices with, ``None`` if they are float32."""
+        return self.meta.get('quantization', {}).get('method')
+
+    def word(self, row: int) -> str:
+        return self._word_bytes(row).decode('utf-8')
+
+    def _word_bytes(self, row):
+        return self._words[self._offsets[row]:self._offsets[row + 1]].tobytes()
+
+    def rows(self, words: List[str]) -> np.ndarray:
+        """
+        Returns the rows of ``words`` in ``self.vectors``, -1 for out-of-vocabulary words.
+        """
+        encoded = [w.encode('utf-8') for w in words]
+        hashes = fnv1a(*pack(encoded))
+        rows = np.empty(len(words), dtype=np.int64)
+        for i, (word, h) in enumerate(zip(encoded, hashes.tolist())):
+            slot = h & self._mask
+            while True:
+                row = int(self._table[slot])
+                if row < 0 or self._word_bytes(row) == word:
+                    break
+                slot = (slot + 1) & self._mask
+            rows[i] = row
+        return rows
+
+
+def build_table(hashes: np.ndarray) -> np.ndarray:
+    """
+    Builds a linear-probing hash table of the row numbers of the given hashes, at most half full.
+    Rows are inserted in rounds: each free slot goes to the first row probing it, and the others
+    move on to their next slot.
+    """
+    size = 1 << (2 * len(hashes)).bit_length()
+    mask = size - 1
+    table = np.full(size, -1, dtype=np.int32)
+    pending = np.arange(len(hashes))
+    slots = hashes.astype(np.int64) & mask
+    while len(pending):
+        free = np.flatnonzero(table[slots] < 0)
+        _, first = np.unique(slots[free], return_index=True)
+        winners = free[first]
+        table[slots[winners]] = pending[winners]
+        losers = np.ones(len(pending), dtype=bool)
+        losers[winners] = False
+        pending = pending[losers]
+        slots = (slots[losers] + 1) & mask
+    return table
+
+
+def export_vocab(model, path: str, subwords: bool = True, chunk_size: int = 10000):
+    """
+    Writes the vectors of the in-vocabulary words of the fasttext ``model`` to the directory
+    ``path``, to be loaded as a ``Vocabulary``. With ``subwords``, the input matrix of the model
+    is written too, to compute the vectors of out-of-vocabulary words without the model.
+    """
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        os.remove(os.path.join(path, 'meta.json'))
+    words = model.get_words()
+    vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+', dtype=np.float32,
+                                        shape=(len(words), model.get_dimension()))
+    for i in range(0, len(words), chunk_size):
+        vectors[i:i + chunk_size] = [model.get_word_vector(w) for w in words[i:i + chunk_size]]
+        print(f'{min(i + chunk_size, len(words))}/{len(words)} words')
+    vectors.flush()
+    del vectors
+
+    buffer, starts, lengths = pack([w.encode('utf-8') for w in words])
+    np.save(os.path.join(path, 'words.npy'), buffer)
+    np.save(os.path.join(path, 'offsets.npy'), np.append(starts, len(buffer)))
+    np.save(os.path.join(path, 'table.npy'), build_table(fnv1a(buffer, starts, lengths)))
+    meta = {'words': len(words), 'dim': model.get_dimension()}
+    if subwords:
+        args = model.f.getArgs()
+        # a view of the model's matrix, which can be larger than the vocabulary vectors
+        np.save(os.path.join(path, 'input.npy'), np.asarray(model.f.getInputMatrix()))
+        meta['subwords'] = {'nwords': len(words), 'minn': args.minn, 'maxn': args.maxn, 'bucket': args.bucket}
+    # written last, so that an interrupted export cannot be loaded
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def quantize_vocab(vocab_path: str, path: str, method: str = 'int8', subspaces: int = 100):
+    """
+    Writes a copy of the exported vocabulary ``vocab_path`` to the directory ``path`` with its
+    matrices quantized, by ``method`` ``'int8'`` (4 times smaller) or ``'pq'`` with ``subspaces``
+    subspaces (one byte per subspace per row).
+    """
+    if method not in ('int8', 'pq'):
+        raise ValueError(f'unknown quantization method: {method}')
+    vocab = Vocabulary(vocab_path)
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        os.remove(os.path.join(path, 'meta.json'))
+    for name in ('words.npy', 'offsets.npy', 'table.npy'):
+        shutil.copyfile(os.path.join(vocab_path, name), os.path.join(path, name))
+
+    matrices = {'vectors': vocab.vectors}
+    if vocab.subwords is not None:
+        matrices['input'] = vocab.subwords.input_matrix
+    for name, matrix in matrices.items():
+        print(f'Quantizing {name} {matrix.shape} with {method}')
+        if method == 'int8':
+            quantize_int8(matrix, path, name)
+        else:
+            quantize_pq(matrix, path, name, subspaces)
+
+    meta = dict(vocab.meta, quantization={'method': method, 'subspaces': subspaces if method == 'pq' else None})
+    # written last, so that an interrupted export cannot be loaded
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)